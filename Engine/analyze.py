@@ -0,0 +1,95 @@
+import argparse
+import json
+import sys
+from multiprocessing import Pool
+from my_engine import *
+
+
+def read_fens(stream):
+    # One FEN per line, blank lines and lines starting with # are skipped
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def analyze_fen(task):
+    """
+    Worker: search one position
+    :param task: (index, fen, settings) where settings is the dict of search settings from the command line
+    :return: dict with the JSONL record of the position
+    """
+    index, fen, settings = task
+    record = {'index': index, 'fen': fen}
+    eval_cache = EvalCache(settings['eval_cache']) if settings['eval_cache'] else None
+    try:
+        engine = Chess(fen, incremental=settings['incremental'], evaluator=settings['evaluator'],
+                       eval_cache=eval_cache)
+    except ValueError as e:
+        record['error'] = str(e)
+        return record
+    stats = None
+    if settings['stats']:
+        stats = SearchStats(sample_every=settings['sample_every'])
+    eval, move, info = iterative_deepening(engine, max_depth=settings['depth'], time_limit=settings['time'],
+                                           node_limit=settings['nodes'], tt=TranspositionTable(settings['hash']),
+                                           search=settings['search'], stats=stats)
+    record['score'] = eval
+    record['best_move'] = move.uci() if move is not None else None
+    record['pv'] = [pv_move.uci() for pv_move in info['pv']]
+    record['depth'] = info['depth']
+    record['nodes'] = info['nodes']
+    record['nps'] = round(info['nodes'] / info['time']) if info['time'] > 0 else 0
+    record['time'] = round(info['time'], 4)
+    if stats is not None:
+        record['stats'] = stats.summary()
+    if eval_cache is not None:
+        record['eval_cache'] = eval_cache.stats()
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze FENs (one per line) and write one JSON record per position '
+                                                 'as soon as it is done. Scores are from white\'s point of view.')
+    parser.add_argument('input', nargs='?', default='-', help='file with FENs, - for stdin (default)')
+    parser.add_argument('-o', '--output', default='-', help='JSONL file to write, - for stdout (default)')
+    parser.add_argument('--depth', type=int, default=None, help='depth per position (default 4 without --time)')
+    parser.add_argument('--time', type=float, default=None, help='seconds per position')
+    parser.add_argument('--nodes', type=int, default=None, help='nodes per position')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--search', default='pvs', choices=('pvs', 'alpha_beta'))
+    parser.add_argument('--evaluator', default='squares', choices=EVALUATORS)
+    parser.add_argument('--no-incremental', dest='incremental', action='store_false',
+                        help='evaluate every leaf from scratch')
+    parser.add_argument('--hash', type=float, default=16, help='transposition table size in MB per position')
+    parser.add_argument('--eval-cache', type=int, default=0, metavar='N',
+                        help='cache up to N evaluations per position (default 0 = off)')
+    parser.add_argument('--stats', action='store_true', help='add search counters and component timings to records')
+    parser.add_argument('--sample-every', type=int, default=64, help='time one call in this many with --stats')
+    args = parser.parse_args()
+
+    depth = args.depth
+    if depth is None:
+        depth = 64 if args.time is not None or args.nodes is not None else 4
+    settings = {'depth': depth, 'time': args.time, 'nodes': args.nodes, 'search': args.search,
+                'evaluator': args.evaluator, 'incremental': args.incremental, 'hash': args.hash,
+                'eval_cache': args.eval_cache,
+                'stats': args.stats, 'sample_every': args.sample_every}
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    tasks = ((index, fen, settings) for index, fen in enumerate(read_fens(source)))
+    try:
+        with Pool(args.workers) as pool:
+            for record in pool.imap_unordered(analyze_fen, tasks):
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
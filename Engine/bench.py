@@ -0,0 +1,252 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from my_engine import *
+
+# The two positions my_engine.py already uses: the default Chess() position and the one searched at the bottom
+FENS = [
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'rnbqkbnr/1pppp1pp/8/p7/4P3/1B3Q2/PPPP1PPP/RNB1K1NR w KQkq - 0 1',
+]
+
+
+# Fixed position set of the benchmark suite: name -> (fen, known perft node counts for depth 1, 2, 3, ...)
+SUITE = {
+    'start': ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', [20, 400, 8902]),
+    'my_engine': ('rnbqkbnr/1pppp1pp/8/p7/4P3/1B3Q2/PPPP1PPP/RNB1K1NR w KQkq - 0 1', []),
+    'italian': ('r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4', []),
+    'kiwipete': ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', [48, 2039, 97862]),
+    'position4': ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467]),
+    'position5': ('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379]),
+    'rook_endgame': ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812]),
+    'pawn_endgame': ('8/8/4k3/8/8/4K3/4P3/8 w - - 0 1', []),
+}
+
+# Suite metrics where a bigger number is better, the others (times, nodes) should go down
+HIGHER_IS_BETTER = ('perft_nps', 'nps', 'evals_per_second')
+# Timings shorter than this (seconds) are mostly noise and are not compared
+MIN_COMPARED_TIME = 0.05
+
+
+class CountingChess(Chess):
+    # Every node except the root is entered through push (get_child pushes on the copy), so this counts nodes
+    # the same way for both search modes
+    pushes = 0
+    evaluations = 0
+
+    def push(self, move):
+        CountingChess.pushes = CountingChess.pushes + 1
+        super().push(move)
+
+    def evaluate(self):
+        CountingChess.evaluations = CountingChess.evaluations + 1
+        return super().evaluate()
+
+
+def run_search(fen, depth, make_unmake, incremental=False, evaluator='squares'):
+    engine = CountingChess(fen, incremental=incremental, evaluator=evaluator)
+    CountingChess.pushes = 0
+    start = time.perf_counter()
+    eval, move = basic_alpha_beta(engine, depth, make_unmake=make_unmake)
+    elapsed = time.perf_counter() - start
+    return eval, move, CountingChess.pushes + 1, elapsed
+
+
+def compare_modes(fens, depth, incremental=False, evaluator='squares'):
+    print('{:<66} {:>11} {:>8} {:>9} {:>8}'.format('fen', 'mode', 'nodes', 'nps', 'move'))
+    for fen in fens:
+        results = {}
+        for make_unmake in (False, True):
+            eval, move, nodes, elapsed = run_search(fen, depth, make_unmake, incremental, evaluator)
+            mode = 'make/unmake' if make_unmake else 'deepcopy'
+            results[mode] = (eval, move, nodes / elapsed)
+            print('{:<66} {:>11} {:>8} {:>9.0f} {:>8}'.format(fen, mode, nodes, nodes / elapsed, str(move)))
+        copy_eval, copy_move, copy_nps = results['deepcopy']
+        eval, move, nps = results['make/unmake']
+        if (eval, move) != (copy_eval, copy_move):
+            print('  MISMATCH: deepcopy {} {} vs make/unmake {} {}'.format(copy_eval, copy_move, eval, move))
+        print('  speedup x{:.2f}'.format(nps / copy_nps))
+
+
+def compare_ordering(fens, depth, incremental=False, evaluator='squares'):
+    # Nodes at a fixed depth with only the TT move first versus the full move ordering
+    print('{:<66} {:>9} {:>9} {:>7}'.format('fen', 'unordered', 'ordered', 'saved'))
+    for fen in fens:
+        nodes = {}
+        for ordered in (False, True):
+            engine = Chess(fen, incremental=incremental, evaluator=evaluator)
+            state = SearchState(order_moves=ordered, quiescence=False)
+            state.root_ply = len(engine.board.move_stack)
+            basic_alpha_beta(engine, depth, make_unmake=True, state=state)
+            nodes[ordered] = state.nodes
+        print('{:<66} {:>9} {:>9} {:>6.0f}%'.format(fen, nodes[False], nodes[True],
+                                                    100 * (1 - nodes[True] / nodes[False])))
+
+
+def compare_pruning(fens, depth, incremental=False, evaluator='squares'):
+    # Nodes and time of a fixed depth pvs search with null move pruning and late move reductions on and off
+    print('{:<66} {:>9} {:>4} {:>9} {:>8} {:>6}'.format('fen', 'null_move', 'lmr', 'nodes', 'time', 'move'))
+    for fen in fens:
+        for null_move, lmr in ((False, False), (True, False), (False, True), (True, True)):
+            engine = Chess(fen, incremental=incremental, evaluator=evaluator)
+            eval, move, info = iterative_deepening(engine, max_depth=depth, null_move=null_move, lmr=lmr)
+            print('{:<66} {:>9} {:>4} {:>9} {:>7.2f}s {:>6}'.format(fen, 'on' if null_move else 'off',
+                                                                   'on' if lmr else 'off', info['nodes'],
+                                                                   info['time'], str(move)))
+
+
+def parallel_scaling(fens, depth, max_workers, incremental=False, evaluator='squares'):
+    # Time to reach depth with parallel_search for 1, 2, 4, ... max_workers processes
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers = workers * 2
+    counts.append(max_workers)
+    print('{:>7} {:>9} {:>9} {:>8}'.format('workers', 'time', 'nodes', 'speedup'))
+    base = None
+    for workers in counts:
+        with ProcessPoolExecutor(workers) as pool:
+            # Start the processes before timing
+            list(pool.map(abs, range(workers)))
+            elapsed = 0
+            nodes = 0
+            for fen in fens:
+                eval, move, info = parallel_search(Chess(fen, incremental=incremental, evaluator=evaluator), depth,
+                                                   workers, pool)
+                elapsed = elapsed + info['time']
+                nodes = nodes + info['nodes']
+        if base is None:
+            base = elapsed
+        print('{:>7} {:>8.2f}s {:>9} {:>7.2f}x'.format(workers, elapsed, nodes, base / elapsed))
+
+
+def perft(engine, depth):
+    # Number of leaf nodes of the legal move tree, played through Chess.push/pop
+    if depth == 0:
+        return 1
+    moves = list(engine.board.legal_moves)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        engine.push(move)
+        nodes = nodes + perft(engine, depth - 1)
+        engine.pop()
+    return nodes
+
+
+def run_suite(depth, perft_depth, incremental=False, evaluator='squares', search='pvs'):
+    """
+    :return: dict with the settings and, per position, perft and search metrics
+    """
+    results = {'settings': {'depth': depth, 'perft_depth': perft_depth, 'incremental': incremental,
+                            'evaluator': evaluator, 'search': search},
+               'positions': {}}
+    for name, (fen, perft_counts) in SUITE.items():
+        engine = Chess(fen, incremental=incremental, evaluator=evaluator)
+        start = time.perf_counter()
+        perft_nodes = perft(engine, perft_depth)
+        perft_time = time.perf_counter() - start
+        row = {'perft_nodes': perft_nodes, 'perft_time': perft_time, 'perft_nps': perft_nodes / perft_time}
+        if perft_depth <= len(perft_counts) and perft_counts[perft_depth - 1] != perft_nodes:
+            row['perft_error'] = 'expected {} nodes'.format(perft_counts[perft_depth - 1])
+
+        engine = CountingChess(fen, incremental=incremental, evaluator=evaluator)
+        CountingChess.evaluations = 0
+        time_to_depth = {}
+
+        def on_iteration(eval, move, info):
+            time_to_depth[str(info['depth'])] = info['time']
+
+        eval, move, info = iterative_deepening(engine, max_depth=depth, search=search, on_iteration=on_iteration)
+        row.update({'best_move': move.uci() if move is not None else None, 'score': eval,
+                    'nodes': info['nodes'], 'time': info['time'], 'nps': info['nodes'] / info['time'],
+                    'evaluations': CountingChess.evaluations,
+                    'evals_per_second': CountingChess.evaluations / info['time'],
+                    'time_to_depth': time_to_depth})
+        results['positions'][name] = row
+        print('{:<13} perft({}) {:>7} {:>8.0f}/s  search d{} {:>7} nodes {:>6.0f} nps {:>6.0f} evals/s {:>7.2f}s {}'.format(
+            name, perft_depth, perft_nodes, row['perft_nps'], info['depth'], info['nodes'], row['nps'],
+            row['evals_per_second'], info['time'], row.get('perft_error', '')))
+    return results
+
+
+def compare_results(results, baseline, threshold):
+    """
+    :param threshold: allowed relative change, 0.1 = 10%
+    :return: list of regression messages
+    """
+    regressions = []
+    if results['settings'] != baseline['settings']:
+        regressions.append('settings differ: {} vs baseline {}'.format(results['settings'], baseline['settings']))
+    for name, row in results['positions'].items():
+        if 'perft_error' in row:
+            regressions.append('{}: perft {} nodes, {}'.format(name, row['perft_nodes'], row['perft_error']))
+        base = baseline['positions'].get(name)
+        if base is None:
+            continue
+        timed = {'perft_nps': 'perft_time', 'nps': 'time', 'evals_per_second': 'time', 'time': 'time'}
+        for metric in ('perft_nps', 'nps', 'evals_per_second', 'time', 'nodes'):
+            new, old = row[metric], base[metric]
+            if old == 0:
+                continue
+            if metric in timed and min(row[timed[metric]], base[timed[metric]]) < MIN_COMPARED_TIME:
+                continue
+            change = (new - old) / old
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            if change > threshold:
+                regressions.append('{}: {} {:.6g} vs baseline {:.6g} ({:+.1f}%)'.format(
+                    name, metric, new, old, 100 * (new - old) / old))
+        for depth, seconds in row['time_to_depth'].items():
+            old = base['time_to_depth'].get(depth)
+            if old and min(seconds, old) >= MIN_COMPARED_TIME and (seconds - old) / old > threshold:
+                regressions.append('{}: time to depth {} {:.3f}s vs baseline {:.3f}s'.format(name, depth, seconds, old))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the search modes of my_engine.py')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--incremental', action='store_true', help='use the incrementally updated evaluation')
+    parser.add_argument('--evaluator', default='squares', choices=EVALUATORS)
+    parser.add_argument('--ordering', action='store_true',
+                        help='compare node counts with and without move ordering instead')
+    parser.add_argument('--pruning', action='store_true',
+                        help='compare pvs with null move pruning and late move reductions on and off instead')
+    parser.add_argument('--parallel', type=int, metavar='N',
+                        help='time to depth of parallel_search with 1 up to N worker processes instead')
+    parser.add_argument('--suite', action='store_true',
+                        help='run the perft and search benchmark suite on a fixed position set instead')
+    parser.add_argument('--perft-depth', type=int, default=3)
+    parser.add_argument('--search', default='pvs', choices=('pvs', 'alpha_beta'))
+    parser.add_argument('--json', metavar='FILE', help='write the suite results to FILE')
+    parser.add_argument('--baseline', metavar='FILE', help='compare the suite results against a stored --json file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown reported as a regression (default 0.1 = 10%%)')
+    args = parser.parse_args()
+    if args.suite:
+        results = run_suite(args.depth, args.perft_depth, args.incremental, args.evaluator, args.search)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare_results(results, json.load(f), args.threshold)
+            for regression in regressions:
+                print('REGRESSION ' + regression)
+            if regressions:
+                sys.exit(1)
+            print('no regressions against ' + args.baseline)
+    elif args.parallel:
+        parallel_scaling(FENS, args.depth, args.parallel, args.incremental, args.evaluator)
+    elif args.pruning:
+        compare_pruning(list(FENS) + [SUITE['italian'][0], SUITE['kiwipete'][0]], args.depth, args.incremental,
+                        args.evaluator)
+    elif args.ordering:
+        compare_ordering(FENS, args.depth, args.incremental, args.evaluator)
+    else:
+        compare_modes(FENS, args.depth, args.incremental, args.evaluator)
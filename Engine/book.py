@@ -0,0 +1,88 @@
+import argparse
+import time
+import chess
+import chess.pgn
+import chess.polyglot
+from my_engine import *
+
+# Weight of a book move per game result from the moving side's point of view, as in polyglot's own builder
+RESULT_POINTS = {'win': 2, 'draw': 1, 'loss': 0}
+MAX_WEIGHT = 65535
+
+
+def read_positions(pgn_path, max_plies):
+    """
+    :return: dict (zobrist key, encoded move) -> points, over the first max_plies moves of every game
+    """
+    counts = {}
+    with open(pgn_path) as f:
+        while True:
+            game = chess.pgn.read_game(f)
+            if game is None:
+                break
+            result = game.headers.get('Result', '*')
+            board = game.board()
+            for ply, move in enumerate(game.mainline_moves()):
+                if ply >= max_plies:
+                    break
+                if result == '1/2-1/2':
+                    points = RESULT_POINTS['draw']
+                elif result == ('1-0' if board.turn == W else '0-1'):
+                    points = RESULT_POINTS['win']
+                elif result in ('1-0', '0-1'):
+                    points = RESULT_POINTS['loss']
+                else:
+                    points = RESULT_POINTS['draw']
+                key = (chess.polyglot.zobrist_hash(board), OpeningBook.encode_move(board, move))
+                counts[key] = counts.get(key, 0) + points
+                board.push(move)
+    return counts
+
+
+def build_book(pgn_path, book_path, max_plies=20, min_points=1):
+    """
+    Write a polyglot book (sorted 16 byte entries) with the moves played in a PGN file
+    :param max_plies: only the opening moves of every game go in the book
+    :param min_points: leave out moves that scored less than this (lost every time, or played rarely)
+    :return: number of entries written
+    """
+    counts = read_positions(pgn_path, max_plies)
+    entries = [(key, move, points) for (key, move), points in counts.items() if points >= min_points]
+    if entries:
+        # Keep the weights in 16 bits without changing their ratios
+        scale = max(1.0, max(points for key, move, points in entries) / MAX_WEIGHT)
+        entries = [(key, move, max(1, int(points / scale))) for key, move, points in entries]
+    entries.sort(key=lambda entry: (entry[0], -entry[2], entry[1]))
+    with open(book_path, 'wb') as f:
+        for key, move, weight in entries:
+            f.write(BOOK_ENTRY.pack(key, move, weight, 0))
+    return len(entries)
+
+
+def probe(book_path, fen):
+    book = OpeningBook(book_path)
+    board = chess.Board(fen)
+    start = time.perf_counter()
+    entries = book.find_all(board)
+    elapsed = time.perf_counter() - start
+    for move, weight in entries:
+        print('{:<7} {:>6}'.format(board.san(move), weight))
+    print('{} moves, lookup {:.1f} us'.format(len(entries), elapsed * 1e6))
+    book.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a polyglot opening book from a PGN file, or look a '
+                                                 'position up in one')
+    parser.add_argument('book', help='book file to write (with --pgn) or read')
+    parser.add_argument('--pgn', help='PGN file to build the book from')
+    parser.add_argument('--max-plies', type=int, default=20, help='plies of every game to put in the book')
+    parser.add_argument('--min-points', type=int, default=1,
+                        help='drop moves with fewer points (2 per win, 1 per draw)')
+    parser.add_argument('--fen', default=chess.STARTING_FEN, help='position to look up')
+    args = parser.parse_args()
+    if args.pgn:
+        count = build_book(args.pgn, args.book, args.max_plies, args.min_points)
+        print('{} entries written to {}'.format(count, args.book))
+    else:
+        probe(args.book, args.fen)
@@ -0,0 +1,228 @@
+import argparse
+import math
+import sys
+import time
+from multiprocessing import Pool
+import chess
+import chess.pgn
+from my_engine import *
+from analyze import read_fens
+
+# Short openings played from both sides when no --openings file is given
+OPENINGS = [
+    'e4 e5 Nf3 Nc6',
+    'e4 c5 Nf3 d6',
+    'e4 e6 d4 d5',
+    'e4 c6 d4 d5',
+    'd4 d5 c4 e6',
+    'd4 Nf6 c4 g6',
+    'c4 e5 Nc3 Nf6',
+    'Nf3 d5 g3 Nf6',
+]
+
+# Settings of an engine configuration and their defaults, everything else is passed on to SearchState
+CONFIG_DEFAULTS = {'depth': 3, 'time': None, 'nodes': None, 'evaluator': 'squares', 'incremental': True,
+                   'search': 'pvs', 'hash': 16}
+
+
+def opening_fens():
+    fens = []
+    for opening in OPENINGS:
+        board = chess.Board()
+        for san in opening.split():
+            board.push_san(san)
+        fens.append(board.fen())
+    return fens
+
+
+def parse_value(value):
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    if value.lower() == 'none':
+        return None
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_config(text):
+    """
+    :param text: comma separated key=value settings, e.g. 'depth=4,evaluator=bitboard,order_moves=false'
+    :return: dict of the configuration, CONFIG_DEFAULTS filled in
+    """
+    config = dict(CONFIG_DEFAULTS)
+    for item in text.split(','):
+        if item.strip():
+            key, value = item.split('=', 1)
+            config[key.strip()] = parse_value(value.strip())
+    if config['evaluator'] not in EVALUATORS:
+        raise ValueError('unknown evaluator {!r}'.format(config['evaluator']))
+    return config
+
+
+def choose_move(engine, config, tt):
+    options = {key: value for key, value in config.items() if key not in CONFIG_DEFAULTS}
+    max_depth = config['depth'] if config['depth'] is not None else 64
+    eval, move, info = iterative_deepening(engine, max_depth=max_depth, time_limit=config['time'],
+                                           node_limit=config['nodes'], tt=tt, search=config['search'], **options)
+    return move, info['nodes']
+
+
+def adjudicate(engine, max_plies, plies):
+    """
+    :return: (result, termination) if the game is over, None otherwise
+    """
+    board = engine.board
+    if board.is_checkmate():
+        return ('0-1' if board.turn == W else '1-0'), 'checkmate'
+    if engine.is_draw():
+        if board.is_stalemate():
+            return '1/2-1/2', 'stalemate'
+        if board.is_insufficient_material():
+            return '1/2-1/2', 'insufficient material'
+        return '1/2-1/2', 'repetition'
+    if board.is_seventyfive_moves():
+        return '1/2-1/2', '75 move rule'
+    if plies >= max_plies:
+        return '1/2-1/2', 'adjudicated after {} plies'.format(max_plies)
+    return None
+
+
+def play_game(task):
+    """
+    Worker: play one game
+    :param task: (game index, opening fen, white config, black config, maximum plies)
+    :return: dict with the game record
+    """
+    index, fen, white, black, max_plies = task
+    engines = {W: (Chess(fen, incremental=white['incremental'], evaluator=white['evaluator']), white,
+                   TranspositionTable(white['hash'])),
+               B: (Chess(fen, incremental=black['incremental'], evaluator=black['evaluator']), black,
+                   TranspositionTable(black['hash']))}
+    board = chess.Board(fen)
+    moves = []
+    nodes = 0
+    start = time.perf_counter()
+    while True:
+        over = adjudicate(engines[W][0], max_plies, len(moves))
+        if over is not None:
+            break
+        engine, config, tt = engines[board.turn]
+        move, searched = choose_move(engine, config, tt)
+        nodes = nodes + searched
+        board.push(move)
+        moves.append(move.uci())
+        for side in (W, B):
+            engines[side][0].push(move)
+    result, termination = over
+    return {'index': index, 'fen': fen, 'moves': moves, 'result': result, 'termination': termination,
+            'nodes': nodes, 'time': time.perf_counter() - start}
+
+
+def elo(wins, draws, losses):
+    """
+    Elo difference of the first engine with a 95% confidence interval from the per game score variance
+    :return: (elo, error) where the interval is elo - error ... elo + error, inf when it can't be bounded (a
+             perfect score, or every game with the same result)
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, math.inf
+    score = (wins + draws / 2) / games
+
+    def to_elo(p):
+        if p <= 0:
+            return -math.inf
+        if p >= 1:
+            return math.inf
+        return 400 * math.log10(p / (1 - p))
+
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if variance == 0:
+        # Every game had the same result (all draws, say): no spread to estimate the error from
+        return to_elo(score), math.inf
+    margin = 1.96 * math.sqrt(variance / games)
+    low, high = to_elo(score - margin), to_elo(score + margin)
+    if math.isinf(low) or math.isinf(high):
+        return to_elo(score), math.inf
+    return to_elo(score), (high - low) / 2
+
+
+def pgn_text(record, white_name, black_name, round_number):
+    board = chess.Board(record['fen'])
+    for uci in record['moves']:
+        board.push(chess.Move.from_uci(uci))
+    game = chess.pgn.Game.from_board(board)
+    game.headers['Event'] = 'my_engine self-play'
+    game.headers['Round'] = str(round_number)
+    game.headers['White'] = white_name
+    game.headers['Black'] = black_name
+    game.headers['Result'] = record['result']
+    game.headers['Termination'] = record['termination']
+    return str(game) + '\n\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play two engine configurations against each other from a list of '
+                                                 'openings, every opening once with each color')
+    parser.add_argument('--a', default='', help='first configuration as key=value,... (default: CONFIG_DEFAULTS)')
+    parser.add_argument('--b', default='', help='second configuration as key=value,...')
+    parser.add_argument('--openings', help='file with opening FENs, one per line (default: built-in openings)')
+    parser.add_argument('--rounds', type=int, default=1, help='times to play through the openings')
+    parser.add_argument('--max-plies', type=int, default=200, help='adjudicate the game as a draw after this')
+    parser.add_argument('--workers', type=int, default=None, help='games played at once (default: all cores)')
+    parser.add_argument('--pgn', help='append finished games to this PGN file')
+    args = parser.parse_args()
+
+    configs = {'A': parse_config(args.a), 'B': parse_config(args.b)}
+    names = {'A': 'A ' + args.a, 'B': 'B ' + args.b}
+    if args.openings:
+        with open(args.openings) as f:
+            fens = list(read_fens(f))
+    else:
+        fens = opening_fens()
+    # Every opening with A as white, then as black
+    pairings = []
+    for round_number in range(args.rounds):
+        for fen in fens:
+            pairings.append((fen, 'A', 'B'))
+            pairings.append((fen, 'B', 'A'))
+    tasks = [(index, fen, configs[white], configs[black], args.max_plies)
+             for index, (fen, white, black) in enumerate(pairings)]
+
+    wins, draws, losses = 0, 0, 0
+    pgn = open(args.pgn, 'a') if args.pgn else None
+    start = time.perf_counter()
+    try:
+        with Pool(args.workers) as pool:
+            for record in pool.imap_unordered(play_game, tasks):
+                fen, white, black = pairings[record['index']]
+                if record['result'] == '1/2-1/2':
+                    draws = draws + 1
+                elif (record['result'] == '1-0') == (white == 'A'):
+                    wins = wins + 1
+                else:
+                    losses = losses + 1
+                if pgn is not None:
+                    pgn.write(pgn_text(record, names[white], names[black], record['index'] + 1))
+                    pgn.flush()
+                print('game {:>4} {} vs {} {:<7} {:>3} plies {:>7.1f}s  {}'.format(
+                    record['index'] + 1, white, black, record['result'], len(record['moves']), record['time'],
+                    record['termination']), file=sys.stderr)
+    finally:
+        if pgn is not None:
+            pgn.close()
+    elapsed = time.perf_counter() - start
+    games = wins + draws + losses
+    difference, error = elo(wins, draws, losses)
+    print('{:.1f} games/hour ({} games in {:.1f}s)'.format(games / elapsed * 3600, games, elapsed))
+    print('A: {}'.format(configs['A']))
+    print('B: {}'.format(configs['B']))
+    print('A vs B: +{} ={} -{}  elo {:+.1f} +/- {:.1f}'.format(wins, draws, losses, difference, error))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,49 @@
 import copy
 import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
 import chess
-from functools import cmp_to_key
-
-
-def sortbyCond(a, b):
-    if (a[0] != b[0]):
-        return (a[0] - b[0])
-    else:
-        return b[1] - a[1]
+import chess.polyglot
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
 
 W = chess.WHITE
 B = chess.BLACK
 
+# Score of a checkmate in the search
+MATE = 10000000
+# Deepest ply the move ordering tables keep track of
+MAX_PLY = 128
+
+# Quiescence search limits per leaf: nodes, plies of captures, and how much a capture may fall short of alpha
+# before it is pruned
+Q_NODE_CAP = 300
+Q_MAX_DEPTH = 8
+DELTA_MARGIN = 200
+
+# Width of the null window used by pvs and half width of the root aspiration window
+NULL_WINDOW = 1
+ASPIRATION_WINDOW = 50
+
+# Null move pruning: depth taken off the null move search and the least depth it is tried at
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+# Late move reductions: quiet moves after the first LMR_MIN_MOVES are searched LMR_REDUCTION plies shallower
+LMR_REDUCTION = 1
+LMR_MIN_MOVES = 3
+LMR_MIN_DEPTH = 3
+
+# Move ordering bands, see order_moves
+ORDER_FIRST = 100000000
+ORDER_CAPTURE = 10000000
+ORDER_PROMOTION = 5000000
+ORDER_KILLER = 1000000
+
 PV = {
     'pawn': 100,
     'knight': 295,
@@ -53,13 +84,158 @@ PV = {
     'late_king_center': 1100
 }
 
+# Region masks used by the bitboard evaluator, ranks and files are 0 based like chess.square_rank/square_file.
+# Masks that differ per side are indexed by color.
+BB_CENTER_PAWN = (chess.BB_FILES[3] | chess.BB_FILES[4]) & (chess.BB_RANKS[4] | chess.BB_RANKS[5])
+BB_PAWN_AT_6 = {W: chess.BB_RANKS[6], B: chess.BB_RANKS[2]}
+BB_PAWN_AT_7 = {W: chess.BB_RANKS[7], B: chess.BB_RANKS[1]}
+BB_EDGE_FILES = chess.BB_FILES[0] | chess.BB_FILES[7]
+BB_CENTER_KNIGHT = ((chess.BB_RANKS[2] | chess.BB_RANKS[3] | chess.BB_RANKS[4] | chess.BB_RANKS[5]) &
+                    (chess.BB_FILES[2] | chess.BB_FILES[3] | chess.BB_FILES[4] | chess.BB_FILES[5]))
+BB_FIANCHETTO = {W: (chess.BB_FILES[2] | chess.BB_FILES[6]) & chess.BB_RANKS[1],
+                 B: (chess.BB_FILES[2] | chess.BB_FILES[6]) & chess.BB_RANKS[6]}
+BB_BACK_RANK = {W: chess.BB_RANK_1, B: chess.BB_RANK_8}
+BB_CENTER_BISHOP = {W: chess.BB_RANKS[2] | chess.BB_RANKS[3] | chess.BB_RANKS[4] | chess.BB_RANKS[5],
+                    B: chess.BB_RANKS[4] | chess.BB_RANKS[5] | chess.BB_RANKS[6] | chess.BB_RANKS[7]}
+BB_KING_CORNER = {W: (chess.BB_FILES[6] | chess.BB_FILES[7]) & chess.BB_RANK_1,
+                  B: (chess.BB_FILES[6] | chess.BB_FILES[7]) & chess.BB_RANK_8}
+
+EVALUATORS = ('squares', 'bitboard', 'tapered')
+
+# Game phase weight per piece type (pawns and kings don't count), PHASE_TOTAL with all pieces on the board
+PHASE_WEIGHTS = [0, 0, 1, 1, 2, 4, 0]
+PHASE_TOTAL = 24
+
+def piece_square_tables():
+    """
+    Middlegame and endgame value of every piece type on every square, for white (black looks them up on the
+    mirrored square). The middlegame tables use the PV terms of the square by square evaluators, on the same
+    squares, except where a term doesn't depend on the square alone: doubled and protected pawns are left out and
+    the attack coefficients aren't applied. Different on purpose: the middlegame king also gets early_king_corner
+    on the queenside castling squares and loses as much off the back rank, and the endgame tables (pawns worth more
+    as they advance, a central king) are new.
+    :return: (middlegame, endgame), lists indexed [piece type][square]
+    """
+    middlegame = [[0] * 64 for i in range(7)]
+    endgame = [[0] * 64 for i in range(7)]
+    for square in chess.SQUARES:
+        rank = chess.square_rank(square)
+        file = chess.square_file(square)
+        center = 2 <= rank <= 5 and 2 <= file <= 5
+        edge = rank in (0, 7) or file in (0, 7)
+
+        if 0 < rank < 7:
+            if rank == 6:
+                middlegame[chess.PAWN][square] = PV['pawn_at_6']
+                endgame[chess.PAWN][square] = PV['pawn_at_7']
+            elif rank == 5:
+                middlegame[chess.PAWN][square] = (PV['pawn'] + PV['pawn_at_6']) / 2
+                endgame[chess.PAWN][square] = PV['pawn_at_6']
+            elif rank in (3, 4) and file in (3, 4):
+                middlegame[chess.PAWN][square] = PV['pawn_in_center']
+                endgame[chess.PAWN][square] = PV['pawn'] if rank == 3 else (PV['pawn'] + PV['pawn_at_6']) / 2
+            else:
+                middlegame[chess.PAWN][square] = PV['pawn']
+                endgame[chess.PAWN][square] = PV['pawn'] if rank < 4 else (PV['pawn'] + PV['pawn_at_6']) / 2
+
+        if edge:
+            knight = PV['corner_knight']
+        elif center:
+            knight = PV['knight_in_center']
+        else:
+            knight = PV['knight']
+        middlegame[chess.KNIGHT][square] = knight
+        endgame[chess.KNIGHT][square] = knight
+
+        if rank == 1 and file in (2, 6):
+            middlegame[chess.BISHOP][square] = PV['fianchetto']
+        elif rank == 0:
+            middlegame[chess.BISHOP][square] = PV['back_rank_bishop']
+        elif 2 <= rank <= 5:
+            middlegame[chess.BISHOP][square] = PV['bishop_in_center']
+        else:
+            middlegame[chess.BISHOP][square] = PV['bishop']
+        endgame[chess.BISHOP][square] = PV['bishop_in_center'] if center else PV['bishop']
+
+        middlegame[chess.ROOK][square] = PV['pig_rook'] if rank == 6 else PV['rook']
+        endgame[chess.ROOK][square] = PV['pig_rook'] if rank == 6 else PV['rook']
+
+        middlegame[chess.QUEEN][square] = PV['early_queen_back_rank'] if rank == 0 else PV['early_queen_else']
+        endgame[chess.QUEEN][square] = PV['queen']
+
+        # Middlegame: castled king behind its pawns, out in the open is worse than the plain value
+        if rank == 0:
+            middlegame[chess.KING][square] = PV['early_king_corner'] if file in (0, 1, 2, 6, 7) else PV['king']
+        else:
+            middlegame[chess.KING][square] = 2 * PV['king'] - PV['early_king_corner']
+        # Endgame: the king belongs in the center
+        if rank in (3, 4) and file in (3, 4):
+            endgame[chess.KING][square] = PV['late_king_center']
+        elif center:
+            endgame[chess.KING][square] = (PV['king'] + PV['late_king_center']) / 2
+        else:
+            endgame[chess.KING][square] = PV['king']
+    return middlegame, endgame
+
+PST_MIDDLEGAME, PST_ENDGAME = piece_square_tables()
+
+def square_terms(board, square):
+    """
+    Contribution of the piece on square to the tapered evaluation
+    :return: (middlegame, endgame, phase), middlegame and endgame signed (positive for white)
+    """
+    piece_type = board.piece_type_at(square)
+    if piece_type is None:
+        return 0, 0, 0
+    if board.occupied_co[W] & chess.BB_SQUARES[square]:
+        return PST_MIDDLEGAME[piece_type][square], PST_ENDGAME[piece_type][square], PHASE_WEIGHTS[piece_type]
+    mirrored = chess.square_mirror(square)
+    return -PST_MIDDLEGAME[piece_type][mirrored], -PST_ENDGAME[piece_type][mirrored], PHASE_WEIGHTS[piece_type]
+
+def taper(middlegame, endgame, phase):
+    # Blend the two scores by the material left, phase is PHASE_TOTAL or more in the opening, 0 with bare pawns
+    phase = min(phase, PHASE_TOTAL)
+    return (middlegame * phase + endgame * (PHASE_TOTAL - phase)) / PHASE_TOTAL
+
 class Chess:
-    def __init__(self, fen='rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'):
+    def __init__(self, fen='rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', incremental=False,
+                 check_incremental=False, evaluator='squares', eval_cache=None,
+                 book=None, tablebase=None):
+        """
+        :param incremental: keep the static (material and square) part of the evaluation up to date on every
+                            push/pop, so evaluate() only has to add the attack dependent terms
+        :param check_incremental: compare every incremental evaluation against the full one (slow, for debugging)
+        :param evaluator: 'squares' walks the board calling the per-piece evaluators, 'bitboard' computes the
+                          same terms with popcounts of the piece bitboards against precomputed region masks,
+                          'tapered' sums middlegame and endgame piece-square tables blended by game phase
+        :param eval_cache: optional EvalCache remembering evaluate() results, shared with the children
+        :param book: optional OpeningBook, iterative_deepening plays its moves without searching
+        :param tablebase: optional Tablebase, probed at the root and inside the search
+        """
+        if evaluator not in EVALUATORS:
+            raise ValueError('unknown evaluator {!r}, expected one of {}'.format(evaluator, EVALUATORS))
         self.board = chess.Board(fen)
         if self.board.turn:
             self.color = W
         else:
             self.color = B
+        self.evaluator = evaluator
+        self.incremental = None
+        self.check_incremental = check_incremental
+        if incremental and evaluator == 'tapered':
+            self.incremental = TaperedEval(self)
+        elif incremental:
+            self.incremental = IncrementalEval(self)
+        self.eval_cache = eval_cache
+        self.book = book
+        self.tablebase = tablebase
+
+    def __deepcopy__(self, memo):
+        # Children get their own board and incremental state but share the evaluation cache, book and tablebase
+        child = copy.copy(self)
+        child.board = copy.deepcopy(self.board, memo)
+        child.incremental = copy.deepcopy(self.incremental, memo)
+        return child
 
     def get_position(self, piece):
 
@@ -149,6 +325,14 @@ class Chess:
             return value
         return -value
 
+    def only_king_and_pawns(self, color):
+        # Positions where zugzwang is common, passing (a null move) could be better than any real move
+        side = 0 if color == W else 1
+        for piece in ('knight', 'bishop', 'rook', 'queen'):
+            if self.get_position(piece)[side]:
+                return False
+        return True
+
     def total_material(self):
         wp = len(self.board.pieces(chess.PAWN, chess.WHITE))
         wn = len(self.board.pieces(chess.KNIGHT, chess.WHITE))
@@ -180,206 +364,251 @@ class Chess:
 
         return attackers, defenders
 
-    def pawn_evaluate(self, position, pawn_position):
-
-        piece = self.board.piece_at(position)
+    def attack_coeff(self, position):
+        # A piece that is attacked more times than it is defended is likely to be lost
         attackers, defenders = self.is_piece_attacked(position)
         if len(attackers) > len(defenders):
-            coeff = 0.35
-        else:
-            coeff = 1
+            return 0.35
+        return 1
+
+    def king_coeff(self, position):
+        attackers, defenders = self.is_piece_attacked(position)
+        if len(attackers) > 0:
+            return -1000
+        return 1
+
+    def pawn_value(self, position, pawn_position):
+        """
+        Value of the pawn at position without the attack coefficient (positive for white, negative for black)
+        :param pawn_position: squares of the white pawns
+        """
+        piece = self.board.piece_at(position)
         rank = chess.square_rank(position)
         file = chess.square_file(position)
         # Check if pawn is near the end
         if piece.color == W:
             if rank == 6:
-                return coeff * PV['pawn_at_6']
+                return PV['pawn_at_6']
             elif rank == 7:
-                return coeff * PV['pawn_at_7']
+                return PV['pawn_at_7']
             elif rank == 8:
-                return coeff * PV['pawn_promotion']
+                return PV['pawn_promotion']
 
         else:
             if rank == 2:
-                return -coeff * PV['pawn_at_6']
+                return -PV['pawn_at_6']
             elif rank == 1:
-                return -coeff * PV['pawn_at_7']
+                return -PV['pawn_at_7']
             elif rank == 8:
-                return -coeff * PV['pawn_promotion']
+                return -PV['pawn_promotion']
 
         # Check for doubled pawns
         temp_rank = rank-1
         temp = 8*temp_rank + file
         if temp in pawn_position:
             if piece.color == W:
-                return coeff * PV['doubled_pawn']
+                return PV['doubled_pawn']
             else:
-                return -coeff * PV['doubled_pawn']
+                return -PV['doubled_pawn']
 
         # Central Pawn
         if (file == 3 or file == 4) and (rank == 4 or rank == 5):
             if piece.color == W:
-                return coeff * PV['pawn_in_center']
+                return PV['pawn_in_center']
             else:
-                return -coeff * PV['pawn_in_center']
+                return -PV['pawn_in_center']
 
         if piece.color == W:
-            return coeff * PV['pawn']
+            return PV['pawn']
         else:
-            return -coeff * PV['pawn']
+            return -PV['pawn']
 
-    def knight_evaluate(self, position):
+    def pawn_evaluate(self, position, pawn_position):
+        return self.attack_coeff(position) * self.pawn_value(position, pawn_position)
 
-        piece = self.board.piece_at(position)
-        attackers, defenders = self.is_piece_attacked(position)
-        if len(attackers) > len(defenders):
-            coeff = 0.35
-        else:
-            coeff = 1
+    def knight_value(self, position):
 
+        piece = self.board.piece_at(position)
         rank = chess.square_rank(position)
         file = chess.square_file(position)
 
         # If knight is back rank
         if file == 0 or file == 7:
             if piece.color == W:
-                return coeff * PV['corner_knight']
+                return PV['corner_knight']
             else:
-                return -coeff * PV['corner_knight']
+                return -PV['corner_knight']
 
         if (1 < rank < 6) and (1 < file < 6):
             if piece.color == W:
-                return coeff * PV['knight_in_center']
+                return PV['knight_in_center']
             else:
-                return -coeff * PV['knight_in_center']
+                return -PV['knight_in_center']
 
         if piece.color == W:
-            return coeff * PV['knight']
+            return PV['knight']
         else:
-            return -coeff * PV['knight']
+            return -PV['knight']
 
-    def bishop_evaluate(self, position):
+    def knight_evaluate(self, position):
+        return self.attack_coeff(position) * self.knight_value(position)
 
-        piece = self.board.piece_at(position)
-        attackers, defenders = self.is_piece_attacked(position)
-        if len(attackers) > len(defenders):
-            coeff = 0.35
-        else:
-            coeff = 1
+    def bishop_value(self, position):
 
+        piece = self.board.piece_at(position)
         rank = chess.square_rank(position)
         file = chess.square_file(position)
 
         if piece.color == W:
             if (file == 2 or file == 6) and rank == 1:
-                return coeff * PV['fianchetto']
+                return PV['fianchetto']
             elif rank == 0:
-                return coeff * PV['back_rank_bishop']
+                return PV['back_rank_bishop']
             elif 2 <= rank <= 5:
-                return coeff * PV['bishop_in_center']
+                return PV['bishop_in_center']
             else:
-                return coeff * PV['bishop']
+                return PV['bishop']
         else:
             if (file == 2 or file == 6) and rank == 6:
-                return -coeff * PV['fianchetto']
+                return -PV['fianchetto']
             elif rank == 7:
-                return -coeff * PV['back_rank_bishop']
+                return -PV['back_rank_bishop']
             elif 4 <= rank <= 7:
-                return -coeff * PV['bishop_in_center']
+                return -PV['bishop_in_center']
             else:
-                return -coeff * PV['bishop']
+                return -PV['bishop']
+
+    def bishop_evaluate(self, position):
+        return self.attack_coeff(position) * self.bishop_value(position)
+
+    def book_move(self):
+        # Book move for the current position, None without a book or when the position isn't in it
+        if self.book is None:
+            return None
+        return self.book.choose(self.board)
+
+    def tablebase_score(self):
+        # Tablebase score from white's point of view, None without tablebases or when the position isn't in them
+        if self.tablebase is None:
+            return None
+        score = self.tablebase.score(self.board)
+        if score is None or self.board.turn == W:
+            return score
+        return -score
+
+    def tablebase_move(self):
+        if self.tablebase is None or self.tablebase.lookup(self.board) is None:
+            return None
+        return self.tablebase.best_move(self.board)
 
     def is_draw(self):
         if self.board.is_stalemate() or self.board.is_insufficient_material() or self.board.is_fivefold_repetition():
             return True
         return False
 
-    def rook_evaluate(self, position):
-
-        piece = self.board.piece_at(position)
-        attackers, defenders = self.is_piece_attacked(position)
-        if len(attackers) > len(defenders):
-            coeff = 0.35
-        else:
-            coeff = 1
-        if piece.color == W:
-            return coeff * PV['rook']
+    def rook_value(self, position):
+        if self.board.color_at(position) == W:
+            return PV['rook']
         else:
-            return -coeff * PV['rook']
-
+            return -PV['rook']
 
-    def queen_evaluate(self, position):
+    def rook_evaluate(self, position):
+        return self.attack_coeff(position) * self.rook_value(position)
 
-        piece = self.board.piece_at(position)
-        attackers, defenders = self.is_piece_attacked(position)
-        if len(attackers) > len(defenders):
-            coeff = 0.35
+    def queen_value(self, position):
+        if self.board.color_at(position) == W:
+            return PV['queen']
         else:
-            coeff = 1
+            return -PV['queen']
 
-        rank = chess.square_rank(position)
-        file = chess.square_file(position)
-        if piece.color == W:
-            return coeff*PV['queen']
-        else:
-            return -coeff*PV['queen']
+    def queen_evaluate(self, position):
+        return self.attack_coeff(position) * self.queen_value(position)
 
-    def king_evaluate(self, position):
+    def king_value(self, position):
 
         piece = self.board.piece_at(position)
         rank = chess.square_rank(position)
         file = chess.square_file(position)
-        attackers, defenders = self.is_piece_attacked(position)
-        if len(attackers) > 0:
-            coeff = -1000
-        else:
-            coeff = 1
+        # Late game when white is down to its king, the same as total_material() < 15 without counting pieces
+        late_game = not self.board.occupied_co[W] & ~self.board.kings
         if piece.color == W:
-            # Check if it is late-game
-            if self.total_material() < 15:
-                return coeff * PV['king']
+            if late_game:
+                return PV['king']
             else:
                 if (file == 6 or file == 7) and rank == 0:
-                    return coeff * PV['early_king_corner']
+                    return PV['early_king_corner']
                 else:
-                    return coeff * PV['king']
+                    return PV['king']
         else:
-            if self.total_material() < 15:
-                return -coeff * PV['king']
+            if late_game:
+                return -PV['king']
             else:
                 if (file == 6 or file == 7) and rank == 7:
-                    return -coeff * PV['early_king_corner']
+                    return -PV['early_king_corner']
                 else:
-                    return -coeff * PV['king']
+                    return -PV['king']
+
+    def king_evaluate(self, position):
+        return self.king_coeff(position) * self.king_value(position)
+
+    def static_value(self, square, pawn_position=None):
+        """
+        Value of the piece on square without the attack dependent coefficient, 0 for an empty square
+        :param pawn_position: squares of the white pawns, looked up from the board if not given
+        """
+        piece_type = self.board.piece_type_at(square)
+        if piece_type is None:
+            return 0
+        if piece_type == chess.PAWN:
+            if pawn_position is None:
+                pawn_position = self.board.pieces(chess.PAWN, W)
+            return self.pawn_value(square, pawn_position)
+        elif piece_type == chess.KNIGHT:
+            return self.knight_value(square)
+        elif piece_type == chess.BISHOP:
+            return self.bishop_value(square)
+        elif piece_type == chess.ROOK:
+            return self.rook_value(square)
+        elif piece_type == chess.QUEEN:
+            return self.queen_value(square)
+        return self.king_value(square)
 
     def get_child(self, move):
         child = copy.deepcopy(self)
-        child.board.push(move)
-        child.color = child.board.turn
+        child.push(move)
         return child
 
-    def check_capture(self):
-        legal_moves = list(self.board.legal_moves)
-
-        if self.color == W:
-            max_eval = -math.inf
-            for move in legal_moves:
-                prev_eval = self.piece_evaluation()
-                child = self.get_child(move)
-                next_eval = child.check_capture()
-                if eval > max_eval:
-                    max_eval = eval
-            return max_eval
+    def push(self, move):
+        # Make a move on this engine's own board (no copy), used by the make/unmake search
+        if self.incremental is not None:
+            self.incremental.push(self, move)
         else:
-            min_eval = math.inf
-            for move in legal_moves:
-                child = self.get_child(move)
-                eval = child.check_capture()
-                if eval < min_eval:
-                    min_eval = eval
-            return min_eval
+            self.board.push(move)
+        self.color = self.board.turn
+
+    def pop(self):
+        if self.incremental is not None:
+            move = self.incremental.pop(self)
+        else:
+            move = self.board.pop()
+        self.color = self.board.turn
+        return move
+
+    def check_capture(self):
+        # Score of the position once the captures on the board have been played out (see quiescence)
+        return quiescence(self)
 
     def evaluate(self):
+        if self.eval_cache is None:
+            return self.evaluate_position()
+        key = self.eval_cache.key(self.board)
+        value = self.eval_cache.get(key)
+        if value is None:
+            value = self.evaluate_position()
+            self.eval_cache.put(key, value)
+        return value
+
+    def evaluate_position(self):
         if self.board.is_checkmate():
             if self.color == W:
                 return math.inf
@@ -388,17 +617,147 @@ class Chess:
         if self.board.is_insufficient_material() or self.board.is_stalemate():
             return 0
 
-        white_pawn_positions, black_pawn_positions = self.get_position('pawn')
-        white_knight_positions, black_knight_positions = self.get_position('knight')
-        white_bishop_positions, black_bishop_positions = self.get_position('bishop')
-        white_rook_positions, black_rook_positions = self.get_position('rook')
-        white_queen_positions, black_queen_positions = self.get_position('queen')
-        white_king_position, black_king_position = self.get_position('king')
+        if self.incremental is not None:
+            value = self.incremental.evaluate(self)
+            if self.check_incremental:
+                full = self.evaluate_tapered() if self.evaluator == 'tapered' else self.evaluate_squares()
+                if not math.isclose(value, full, rel_tol=1e-9, abs_tol=1e-6):
+                    raise AssertionError('incremental evaluation {} != full evaluation {} for {}'.format(
+                        value, full, self.board.fen()))
+            return value
+        if self.evaluator == 'bitboard':
+            return self.evaluate_bitboard()
+        if self.evaluator == 'tapered':
+            return self.evaluate_tapered()
+        return self.evaluate_squares()
+
+    def evaluate_tapered(self):
+        # Piece-square table sum, with the game phase computed once for the whole position
+        board = self.board
+        middlegame = 0
+        endgame = 0
+        phase = 0
+        for color, sign in ((W, 1), (B, -1)):
+            for piece_type in chess.PIECE_TYPES:
+                mask = board.pieces_mask(piece_type, color)
+                if not mask:
+                    continue
+                mg_table = PST_MIDDLEGAME[piece_type]
+                eg_table = PST_ENDGAME[piece_type]
+                for square in chess.scan_forward(mask):
+                    if color == B:
+                        square = chess.square_mirror(square)
+                    middlegame = middlegame + sign * mg_table[square]
+                    endgame = endgame + sign * eg_table[square]
+                phase = phase + PHASE_WEIGHTS[piece_type] * chess.popcount(mask)
+        return taper(middlegame, endgame, phase)
+
+    def weak_pieces(self):
+        """
+        :return: (bitboard of the non-king pieces attacked more times than they are defended,
+                  bitboard of the kings in check)
+        """
+        board = self.board
+        weak = 0
+        for color in (W, B):
+            enemy_attacks = 0
+            for square in chess.scan_forward(board.occupied_co[not color]):
+                enemy_attacks = enemy_attacks | board.attacks_mask(square)
+            for square in chess.scan_forward(enemy_attacks & board.occupied_co[color] & ~board.kings):
+                attackers = chess.popcount(board.attackers_mask(not color, square))
+                defenders = chess.popcount(board.attackers_mask(color, square))
+                if attackers > defenders:
+                    weak = weak | chess.BB_SQUARES[square]
+        checked = 0
+        for color in (W, B):
+            king = board.king(color)
+            if king is not None and board.attackers_mask(not color, king):
+                checked = checked | chess.BB_SQUARES[king]
+        return weak, checked
+
+    def evaluate_bitboard(self):
+        # Same terms as evaluate_squares, counted per region instead of per square
+        board = self.board
+        weak, checked = self.weak_pieces()
+
+        def weighted(mask):
+            # Pieces attacked more than defended count 0.35
+            return chess.popcount(mask & ~weak) + 0.35 * chess.popcount(mask & weak)
+
+        # Black pawns are compared against the white pawn positions as well (see evaluate_squares)
+        below_white_pawn = (board.pawns & board.occupied_co[W]) << 8 & chess.BB_ALL
+        white_bare = not (board.occupied_co[W] & ~board.kings)
+        total = 0
+        for color, sign in ((W, 1), (B, -1)):
+            own = board.occupied_co[color]
+
+            pawns = board.pawns & own
+            at_7 = pawns & BB_PAWN_AT_7[color]
+            at_6 = pawns & BB_PAWN_AT_6[color]
+            rest = pawns & ~at_7 & ~at_6
+            doubled = rest & below_white_pawn
+            rest = rest & ~doubled
+            center = rest & BB_CENTER_PAWN
+            rest = rest & ~center
+            value = (PV['pawn_at_7'] * weighted(at_7) + PV['pawn_at_6'] * weighted(at_6) +
+                     PV['doubled_pawn'] * weighted(doubled) + PV['pawn_in_center'] * weighted(center) +
+                     PV['pawn'] * weighted(rest))
+
+            knights = board.knights & own
+            edge = knights & BB_EDGE_FILES
+            center = knights & ~edge & BB_CENTER_KNIGHT
+            value = value + (PV['corner_knight'] * weighted(edge) + PV['knight_in_center'] * weighted(center) +
+                             PV['knight'] * weighted(knights & ~edge & ~center))
+
+            bishops = board.bishops & own
+            fianchetto = bishops & BB_FIANCHETTO[color]
+            back_rank = bishops & ~fianchetto & BB_BACK_RANK[color]
+            center = bishops & ~fianchetto & ~back_rank & BB_CENTER_BISHOP[color]
+            rest = bishops & ~fianchetto & ~back_rank & ~center
+            value = value + (PV['fianchetto'] * weighted(fianchetto) + PV['back_rank_bishop'] * weighted(back_rank) +
+                             PV['bishop_in_center'] * weighted(center) + PV['bishop'] * weighted(rest))
+
+            value = value + PV['rook'] * weighted(board.rooks & own) + PV['queen'] * weighted(board.queens & own)
+
+            king = board.kings & own
+            if king:
+                if not white_bare and king & BB_KING_CORNER[color]:
+                    king_value = PV['early_king_corner']
+                else:
+                    king_value = PV['king']
+                if king & checked:
+                    king_value = -1000 * king_value
+                value = value + king_value
 
-        # For knowing which part of the game it is (early, middle, late)
-        half_moves = len(self.board.move_stack)
-        no_of_minor_pieces = len(white_knight_positions) + len(white_bishop_positions) + len(
-            black_bishop_positions) + len(black_knight_positions)
+            total = total + sign * value
+        return total
+
+    def attack_correction(self, values):
+        """
+        Difference between the attack weighted evaluation and the plain sum of the static values. Only pieces on
+        squares the opponent attacks can have a coefficient other than 1, so the others are skipped.
+        :param values: static value of every square (see static_value)
+        """
+        board = self.board
+        correction = 0
+        for color in (W, B):
+            enemy_attacks = 0
+            for square in chess.scan_forward(board.occupied_co[not color]):
+                enemy_attacks = enemy_attacks | board.attacks_mask(square)
+            for square in chess.scan_forward(enemy_attacks & board.occupied_co[color]):
+                value = values[square]
+                if board.kings & chess.BB_SQUARES[square]:
+                    correction = correction + (-1000 * value - value)
+                else:
+                    attackers = chess.popcount(board.attackers_mask(not color, square))
+                    defenders = chess.popcount(board.attackers_mask(color, square))
+                    if attackers > defenders:
+                        correction = correction + (0.35 * value - value)
+        return correction
+
+    def evaluate_squares(self):
+        # Full evaluation, walking over all 64 squares
+        white_pawn_positions, black_pawn_positions = self.get_position('pawn')
 
         white_eval = 0
         black_eval = 0
@@ -438,67 +797,1556 @@ class Chess:
 
         return white_eval + black_eval
 
-def basic_alpha_beta(engine, depth=3, alpha=-math.inf, beta=math.inf):
+class IncrementalEval:
+    def __init__(self, engine):
+        """
+        Static value of every square (see Chess.static_value) and their sum, updated by Chess.push/pop.
+        A push changes at most a handful of squares: the ones the move touches, the squares right above them
+        (a pawn's doubled pawn check looks at the square below it) and both kings when white runs out of material.
+        """
+        self.rebuild(engine)
+
+    @staticmethod
+    def marker(board):
+        # Used to notice moves pushed straight onto engine.board instead of through Chess.push
+        if board.move_stack:
+            return len(board.move_stack), board.move_stack[-1]
+        return 0, None
+
+    def rebuild(self, engine):
+        white_pawns = engine.board.pieces(chess.PAWN, W)
+        self.values = [engine.static_value(square, white_pawns) for square in chess.SQUARES]
+        self.total = sum(self.values)
+        self.undo = []
+        self.synced = self.marker(engine.board)
+
+    def push(self, engine, move):
+        board = engine.board
+        if self.synced != self.marker(board):
+            self.rebuild(engine)
+
+        changed = [move.from_square, move.to_square]
+        if board.is_en_passant(move):
+            if board.turn == W:
+                changed.append(move.to_square - 8)
+            else:
+                changed.append(move.to_square + 8)
+        elif board.is_castling(move):
+            rank = chess.square_rank(move.from_square)
+            for file in (0, 2, 3, 5, 6, 7):
+                changed.append(chess.square(file, rank))
+        white_bare = not (board.occupied_co[W] & ~board.kings)
+
+        board.push(move)
+
+        affected = set(changed)
+        for square in changed:
+            if square < 56:
+                affected.add(square + 8)
+        # King values depend on whether white has any material left
+        if white_bare != (not (board.occupied_co[W] & ~board.kings)):
+            affected.update(chess.scan_forward(board.kings))
+
+        white_pawns = board.pieces(chess.PAWN, W)
+        record = []
+        total = self.total
+        for square in affected:
+            value = engine.static_value(square, white_pawns)
+            old = self.values[square]
+            if value != old:
+                record.append((square, old))
+                self.values[square] = value
+                self.total = self.total + value - old
+        self.undo.append((record, total))
+        self.synced = self.marker(board)
+
+    def pop(self, engine):
+        board = engine.board
+        in_sync = self.synced == self.marker(board)
+        move = board.pop()
+        if in_sync and self.undo:
+            record, self.total = self.undo.pop()
+            for square, value in record:
+                self.values[square] = value
+            self.synced = self.marker(board)
+        else:
+            self.rebuild(engine)
+        return move
+
+    def evaluate(self, engine):
+        if self.synced != self.marker(engine.board):
+            self.rebuild(engine)
+        return self.total + engine.attack_correction(self.values)
+
+class TaperedEval:
+    def __init__(self, engine):
+        """
+        Middlegame and endgame sums and game phase of the tapered evaluation, updated by Chess.push/pop from the
+        squares a move touches
+        """
+        self.rebuild(engine)
+
+    def rebuild(self, engine):
+        board = engine.board
+        self.middlegame, self.endgame, self.phase = 0, 0, 0
+        for square in chess.scan_forward(board.occupied):
+            middlegame, endgame, phase = square_terms(board, square)
+            self.middlegame = self.middlegame + middlegame
+            self.endgame = self.endgame + endgame
+            self.phase = self.phase + phase
+        self.undo = []
+        self.synced = IncrementalEval.marker(board)
+
+    def push(self, engine, move):
+        board = engine.board
+        if self.synced != IncrementalEval.marker(board):
+            self.rebuild(engine)
+        changed = [move.from_square, move.to_square]
+        if board.is_en_passant(move):
+            changed.append(move.to_square - 8 if board.turn == W else move.to_square + 8)
+        elif board.is_castling(move):
+            rank = chess.square_rank(move.from_square)
+            changed.extend(chess.square(file, rank) for file in (0, 3, 5, 7))
+        changed = set(changed)
+        before = [square_terms(board, square) for square in changed]
+        board.push(move)
+        after = [square_terms(board, square) for square in changed]
+        self.undo.append((self.middlegame, self.endgame, self.phase))
+        for terms in before:
+            self.middlegame, self.endgame, self.phase = (self.middlegame - terms[0], self.endgame - terms[1],
+                                                         self.phase - terms[2])
+        for terms in after:
+            self.middlegame, self.endgame, self.phase = (self.middlegame + terms[0], self.endgame + terms[1],
+                                                         self.phase + terms[2])
+        self.synced = IncrementalEval.marker(board)
+
+    def pop(self, engine):
+        board = engine.board
+        in_sync = self.synced == IncrementalEval.marker(board)
+        move = board.pop()
+        if in_sync and self.undo:
+            self.middlegame, self.endgame, self.phase = self.undo.pop()
+            self.synced = IncrementalEval.marker(board)
+        else:
+            self.rebuild(engine)
+        return move
+
+    def evaluate(self, engine):
+        if self.synced != IncrementalEval.marker(engine.board):
+            self.rebuild(engine)
+        return taper(self.middlegame, self.endgame, self.phase)
+
+class EvalCache:
+    def __init__(self, size=100000):
+        """
+        Bounded cache of Chess.evaluate() results with least recently used eviction, separate from the search's
+        transposition table.
+
+        :param size: maximum number of positions kept
+        """
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(board):
+        # Exact position key: pieces, side to move, castling rights and en passant square
+        return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+                board.occupied_co[W], board.occupied_co[B], board.turn, board.castling_rights, board.ep_square)
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions = self.evictions + 1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': self.size,
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+# Bound types stored in the transposition table
+EXACT = 0
+LOWER = 1  # search failed high, real score is >= stored score
+UPPER = 2  # search failed low, real score is <= stored score
+
+# Polyglot book entry: zobrist key, move, weight, learn (big endian, 16 bytes)
+BOOK_ENTRY = struct.Struct('>QHHI')
+BOOK_PROMOTIONS = [None, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]
+
+class OpeningBook:
+    def __init__(self, path):
+        """
+        Polyglot opening book: entries sorted by key, memory mapped and binary searched, so a lookup reads only
+        the few entries it needs.
+
+        :param path: book file, build one from a PGN with book.py
+        """
+        self.path = path
+        self.file = open(path, 'rb')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.data = b''
+        else:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data) // BOOK_ENTRY.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def key_at(self, index):
+        return BOOK_ENTRY.unpack_from(self.data, index * BOOK_ENTRY.size)[0]
+
+    @staticmethod
+    def encode_move(board, move):
+        # Polyglot writes castling as the king taking its own rook
+        to_square = move.to_square
+        if board.is_castling(move):
+            file = 7 if board.is_kingside_castling(move) else 0
+            to_square = chess.square(file, chess.square_rank(move.from_square))
+        promotion = BOOK_PROMOTIONS.index(move.promotion)
+        return to_square | move.from_square << 6 | promotion << 12
+
+    @staticmethod
+    def decode_move(board, raw):
+        from_square = raw >> 6 & 63
+        to_square = raw & 63
+        promotion = BOOK_PROMOTIONS[raw >> 12 & 7]
+        if board.piece_type_at(from_square) == chess.KING and board.piece_at(to_square) == chess.Piece(
+                chess.ROOK, board.turn):
+            file = 6 if to_square > from_square else 2
+            to_square = chess.square(file, chess.square_rank(from_square))
+        return chess.Move(from_square, to_square, promotion)
+
+    def find_all(self, board):
+        """
+        :return: list of (move, weight) for the position, legal moves only, highest weight first
+        """
+        key = chess.polyglot.zobrist_hash(board)
+        # First entry with this key
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        index = low
+        while index < self.size:
+            entry_key, raw, weight, learn = BOOK_ENTRY.unpack_from(self.data, index * BOOK_ENTRY.size)
+            if entry_key != key:
+                break
+            move = self.decode_move(board, raw)
+            if board.is_legal(move):
+                entries.append((move, weight))
+            index = index + 1
+        entries.sort(key=lambda entry: -entry[1])
+        return entries
+
+    def choose(self, board):
+        # Move with the highest weight, None if the position isn't in the book
+        entries = self.find_all(board)
+        if not entries:
+            return None
+        return entries[0][0]
+
+# Tablebase values, one byte per position from the side to move's point of view: 0 draw, 1..127 win in that many
+# plies, TB_LOSS + n lost in n plies (TB_LOSS itself is checkmated), TB_ILLEGAL for impossible placements
+TB_DRAW = 0
+TB_LOSS = 128
+TB_ILLEGAL = 255
+# Search score of a tablebase win, minus the plies to mate so shorter wins are preferred
+TB_WIN = MATE // 2
+# Piece letters in the order a material signature such as 'KQvK' lists them
+TB_PIECES = 'KQRBNP'
+
+def mate_plies(score):
+    """
+    :param score: search score, pvs scores a checkmate as MATE and a tablebase win as TB_WIN minus the plies to it
+    :return: plies to the checkmate for a mate or tablebase score of either sign, None for any other score
+    """
+    score = abs(score)
+    if MATE - MAX_PLY <= score <= MATE:
+        return MATE - score
+    if TB_WIN - TB_LOSS - MAX_PLY <= score <= TB_WIN:
+        return TB_WIN - score
+    return None
+
+def score_to_tt(score, ply):
+    # Mate and tablebase scores count plies from the root, the table keeps them counted from its own position
+    if mate_plies(score) is None:
+        return score
+    return score + ply if score > 0 else score - ply
+
+def score_from_tt(score, ply):
+    if mate_plies(score) is None:
+        return score
+    return score - ply if score > 0 else score + ply
+
+class Tablebase:
+    def __init__(self, directory=None):
+        """
+        Win/draw/loss and distance to mate for small endgames, one memory mapped table per material signature
+        ('KQvK', 'KRvK', 'KPvK', ...) with the stronger side as white. Build the tables with tablebase.py.
+
+        :param directory: folder with <signature>.tb files to load, None to start empty
+        """
+        self.tables = {}
+        self.files = []
+        self.max_pieces = 0
+        if directory is not None:
+            for name in sorted(os.listdir(directory)):
+                if name.endswith('.tb'):
+                    self.load(os.path.join(directory, name))
+
+    def load(self, path):
+        f = open(path, 'rb')
+        self.files.append(f)
+        self.add(os.path.basename(path)[:-3], mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def add(self, name, data):
+        if len(data) != 2 * 64 ** len(self.pieces(name)):
+            raise ValueError('table {} has {} bytes, expected {}'.format(name, len(data),
+                                                                         2 * 64 ** len(self.pieces(name))))
+        self.tables[name] = data
+        self.max_pieces = max(self.max_pieces, len(self.pieces(name)))
+
+    def close(self):
+        for data in self.tables.values():
+            if isinstance(data, mmap.mmap):
+                data.close()
+        for f in self.files:
+            f.close()
+        self.tables = {}
+        self.files = []
+
+    @staticmethod
+    def pieces(name):
+        # 'KRvK' -> [(W, ROOK) ...]: the (color, piece type) of every square in a table index, in order
+        white, black = name.split('v')
+        return ([(W, chess.PIECE_SYMBOLS.index(letter.lower())) for letter in white] +
+                [(B, chess.PIECE_SYMBOLS.index(letter.lower())) for letter in black])
+
+    @staticmethod
+    def material(board, color):
+        return ''.join(letter * chess.popcount(board.pieces_mask(chess.PIECE_SYMBOLS.index(letter.lower()), color))
+                       for letter in TB_PIECES)
+
+    @staticmethod
+    def index(board, order):
+        # Side to move, then the squares of the pieces in table order (same pieces by ascending square)
+        index = 0 if board.turn == W else 1
+        previous = None
+        for color, piece_type in order:
+            if (color, piece_type) != previous:
+                squares = iter(chess.SquareSet(board.pieces_mask(piece_type, color)))
+                previous = (color, piece_type)
+            index = index * 64 + next(squares)
+        return index
+
+    def lookup(self, board):
+        """
+        :return: (table name, index) of the position, None if no table covers it
+        """
+        if chess.popcount(board.occupied) > self.max_pieces or board.castling_rights or board.has_legal_en_passant():
+            return None
+        white = self.material(board, W)
+        black = self.material(board, B)
+        name = white + 'v' + black
+        if name not in self.tables:
+            name = black + 'v' + white
+            if name not in self.tables:
+                return None
+            board = board.mirror()
+        return name, self.index(board, self.pieces(name))
+
+    def probe(self, board):
+        """
+        :return: (wdl, plies) for the side to move, wdl is 1 win, 0 draw or -1 loss and plies the distance to
+                 mate (0 for a draw), None if the position isn't in the tables
+        """
+        found = self.lookup(board)
+        if found is None:
+            return None
+        value = self.tables[found[0]][found[1]]
+        if value == TB_DRAW or value == TB_ILLEGAL:
+            return 0, 0
+        if value >= TB_LOSS:
+            return -1, value - TB_LOSS
+        return 1, value
+
+    def score(self, board):
+        # Search score for the side to move, None if the position isn't in the tables
+        result = self.probe(board)
+        if result is None:
+            return None
+        wdl, plies = result
+        if wdl == 0:
+            return 0
+        return wdl * (TB_WIN - plies)
+
+    def best_move(self, board):
+        # Fastest win, else a draw, else the slowest loss. None if any move leaves the tables.
+        best, best_move = None, None
+        board = board.copy(stack=False)
+        for move in list(board.legal_moves):
+            board.push(move)
+            if board.is_checkmate():
+                score = TB_WIN + 1
+            elif board.is_insufficient_material() or board.is_stalemate():
+                score = 0
+            else:
+                score = self.score(board)
+                score = None if score is None else -score
+            board.pop()
+            if score is None:
+                return None
+            if best is None or score > best:
+                best, best_move = score, move
+        return best_move
+
+class TranspositionTable:
+    # Size of one stored entry in bytes, measured with tracemalloc: the (key, depth, score, bound, move) tuple (80),
+    # the 64 bit key (40), a float score (24), the chess.Move (112) and the list slot (8). Turns the memory budget
+    # into slots.
+    ENTRY_BYTES = 264
+
+    def __init__(self, size_mb=16):
+        """
+        Fixed size table keyed on the Zobrist hash of the board. Every index holds two entries:
+            depth_slots: depth-preferred, only replaced by a search that is at least as deep
+            always_slots: always-replace, takes everything the depth-preferred slot refuses
+
+        :param size_mb: memory budget for the table in megabytes, filled completely once every slot is in use
+        """
+        entries = max(2, int(size_mb * 1024 * 1024) // self.ENTRY_BYTES)
+        # As many indices as the budget holds: rounding down to a power of two for a mask could halve the table
+        slots = entries // 2
+        self.size = slots
+        self.depth_slots = [None] * slots
+        self.always_slots = [None] * slots
+        self.clear_stats()
+
+    def clear_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def clear(self):
+        self.depth_slots = [None] * self.size
+        self.always_slots = [None] * self.size
+        self.clear_stats()
+
+    @staticmethod
+    def hash(board):
+        return chess.polyglot.zobrist_hash(board)
+
+    def probe(self, key):
+        """
+        :param key: Zobrist hash of the position
+        :return: (key, depth, score, bound, move) or None
+        """
+        index = key % self.size
+        entry = self.depth_slots[index]
+        if entry is not None and entry[0] == key:
+            self.hits = self.hits + 1
+            return entry
+        other = self.always_slots[index]
+        if other is not None and other[0] == key:
+            self.hits = self.hits + 1
+            return other
+        # Slot was filled by a different position that maps to the same index
+        if entry is not None or other is not None:
+            self.collisions = self.collisions + 1
+        self.misses = self.misses + 1
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        index = key % self.size
+        entry = (key, depth, score, bound, move)
+        self.stores = self.stores + 1
+        current = self.depth_slots[index]
+        if current is None or current[0] == key or depth >= current[1]:
+            self.depth_slots[index] = entry
+        else:
+            self.always_slots[index] = entry
+
+    def usage(self):
+        """
+        :return: fraction of the slots in use
+        """
+        used = 0
+        for i in range(self.size):
+            if self.depth_slots[i] is not None:
+                used = used + 1
+            if self.always_slots[i] is not None:
+                used = used + 1
+        return used / (2 * self.size)
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'collisions': self.collisions,
+            'stores': self.stores,
+            'hit_rate': self.hits / probes if probes else 0.0,
+        }
+
+class SearchState:
+    def __init__(self, time_limit=None, node_limit=None, order_moves=True, quiescence=True, see_filter=False,
+                 stats=None, null_move=True, lmr=True, history=None):
+        """
+        Limits, counters, switches and move ordering tables shared by every node of one search
+
+        :param time_limit: seconds the search may take, None for no limit
+        :param node_limit: number of nodes the search may visit, None for no limit
+        :param order_moves: sort moves (see order_moves) instead of only putting the TT move first
+        :param quiescence: evaluate the leaves with quiescence() instead of Chess.evaluate()
+        :param see_filter: skip captures that lose material according to static exchange evaluation in quiescence
+        :param stats: optional SearchStats collecting counters for this search
+        :param null_move: null move pruning in pvs
+        :param lmr: late move reductions in pvs
+        :param history: history table to continue from (e.g. the previous move's search), a new one if None
+        """
+        self.start = time.perf_counter()
+        self.deadline = None
+        self.time_limit = None
+        self.limit_start = self.start
+        if time_limit is not None:
+            self.set_time_limit(time_limit)
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.stopped = False
+        # Length of the move stack at the root, to know how deep in the tree a node is
+        self.root_ply = 0
+        # Move searched first at the root (the best move of the previous iteration)
+        self.root_move = None
+        self.order_moves = order_moves
+        # Two quiet moves per ply that caused a cutoff in a sibling node
+        self.killers = [[None, None] for i in range(MAX_PLY)]
+        # Depth weighted count of cutoffs per (color, from square, to square) for quiet moves
+        self.history = history if history is not None else [0] * (2 * 64 * 64)
+        self.quiescence = quiescence
+        self.see_filter = see_filter
+        self.q_node_cap = Q_NODE_CAP
+        self.q_max_depth = Q_MAX_DEPTH
+        self.qnodes = 0
+        # qnodes value at which the current leaf's quiescence search stops looking at captures
+        self.q_limit = 0
+        self.stats = stats
+        self.null_move = null_move
+        self.lmr = lmr
+
+    def tick(self):
+        """ Count a node and check the limits
+        :return: True if the search has to stop
+        """
+        self.nodes = self.nodes + 1
+        if not self.stopped:
+            if self.node_limit is not None and self.nodes >= self.node_limit:
+                self.stopped = True
+            elif self.deadline is not None and time.perf_counter() >= self.deadline:
+                self.stopped = True
+        return self.stopped
+
+    def stop(self):
+        self.stopped = True
+
+    def set_time_limit(self, seconds):
+        # Limit the search to seconds from now, also while it is running (a ponder search when the move comes)
+        self.limit_start = time.perf_counter()
+        self.time_limit = seconds
+        self.deadline = self.limit_start + seconds
+
+    def ply(self, engine):
+        return len(engine.board.move_stack) - self.root_ply
+
+    def cutoff(self, engine, move, depth, index):
+        """ Record a beta cutoff
+        :param index: position of move in the ordered move list
+        """
+        if self.stats is not None:
+            self.stats.cutoff(index)
+        if not engine.board.is_capture(move) and not move.promotion:
+            self.add_cutoff(engine, move, depth)
+
+    def add_cutoff(self, engine, move, depth):
+        # Remember a quiet move that caused a beta cutoff (killer for this ply, history for the whole search)
+        ply = self.ply(engine)
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        index = int(engine.board.turn) * 4096 + move.from_square * 64 + move.to_square
+        self.history[index] = self.history[index] + depth * depth
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+class SearchStats:
+    # Functions whose time is measured while profiling: name -> (owner, attribute)
+    COMPONENTS = {
+        'evaluate': ('Chess', 'evaluate'),
+        'is_piece_attacked': ('Chess', 'is_piece_attacked'),
+        'attack_correction': ('Chess', 'attack_correction'),
+        'weak_pieces': ('Chess', 'weak_pieces'),
+        'get_child': ('Chess', 'get_child'),
+        'push': ('Chess', 'push'),
+        'pop': ('Chess', 'pop'),
+        'is_draw': ('Chess', 'is_draw'),
+        'zobrist_hash': ('TranspositionTable', 'hash'),
+        'is_checkmate': ('Board', 'is_checkmate'),
+        'legal_moves': ('Board', 'generate_legal_moves'),
+    }
+    # Cutoffs are counted per move index up to this many, later indices share the last bucket
+    CUTOFF_BUCKETS = 16
+
+    def __init__(self, sample_every=64, timers=True):
+        """
+        Counters and component timers for one or more searches, summed until reset() is called.
+
+        Counters are plain integer increments. Timers wrap the COMPONENTS functions for the duration of profile()
+        and only time one call out of sample_every, the totals are then estimated from the sampled calls. Times are
+        inclusive (get_child includes the push it does).
+
+        :param sample_every: time one call in this many, 1 to time every call
+        :param timers: False to only keep the counters
+        """
+        self.sample_every = sample_every
+        self.timers = timers
+        self.reset()
+
+    def reset(self):
+        self.searches = 0
+        self.nodes = 0
+        self.qnodes = 0
+        self.leaf_evals = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.time = 0
+        self.cutoffs = [0] * self.CUTOFF_BUCKETS
+        self.null_moves = 0
+        self.null_cutoffs = 0
+        self.reductions = 0
+        self.re_searches = 0
+        self.calls = {}
+        self.sampled = {}
+        self.sampled_time = {}
+        for name in self.COMPONENTS:
+            self.calls[name] = 0
+            self.sampled[name] = 0
+            self.sampled_time[name] = 0
+
+    def cutoff(self, index):
+        self.cutoffs[min(index, self.CUTOFF_BUCKETS - 1)] += 1
+
+    def add_search(self, state, tt_probes=0, tt_hits=0):
+        self.searches = self.searches + 1
+        self.nodes = self.nodes + state.nodes
+        self.qnodes = self.qnodes + state.qnodes
+        self.tt_probes = self.tt_probes + tt_probes
+        self.tt_hits = self.tt_hits + tt_hits
+        self.time = self.time + state.elapsed()
+
+    def record(self, name, function, generator, args, kwargs):
+        # One call of a profiled component made by this SearchStats' search
+        count = self.calls[name] + 1
+        self.calls[name] = count
+        if count % self.sample_every:
+            return function(*args, **kwargs)
+        self.sampled[name] = self.sampled[name] + 1
+        if generator:
+            return self.timed_generator(name, function(*args, **kwargs))
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.sampled_time[name] = self.sampled_time[name] + time.perf_counter() - start
+        return result
+
+    def timed_generator(self, name, iterator):
+        # Time each next() the caller actually makes, so callers that stop early (any(...)) are not charged for
+        # the moves they never asked for
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.sampled_time[name] = self.sampled_time[name] + time.perf_counter() - start
+                return
+            self.sampled_time[name] = self.sampled_time[name] + time.perf_counter() - start
+            yield item
+
+    @contextmanager
+    def profile(self):
+        """
+        Time the COMPONENTS while inside the with block. Only calls made by the thread that entered the block are
+        counted, so searches profiling on other threads at the same time (UCI, Ponderer) keep separate numbers.
+        Nested profile() blocks count into the innermost SearchStats.
+        """
+        if not self.timers:
+            yield self
+            return
+        thread = threading.get_ident()
+        with profile_lock:
+            install_profiling()
+            profilers.setdefault(thread, []).append(self)
+        try:
+            yield self
+        finally:
+            with profile_lock:
+                profilers[thread].pop()
+                if not profilers[thread]:
+                    del profilers[thread]
+                uninstall_profiling()
+
+    def summary(self):
+        """
+        :return: dict with the counters and, per component, calls, sampled calls, mean and estimated total time
+        """
+        components = {}
+        for name in self.COMPONENTS:
+            if self.sampled[name]:
+                mean = self.sampled_time[name] / self.sampled[name]
+                components[name] = {'calls': self.calls[name], 'sampled': self.sampled[name],
+                                    'mean_us': mean * 1e6, 'total_s': mean * self.calls[name]}
+        total_cutoffs = sum(self.cutoffs)
+        return {
+            'searches': self.searches,
+            'nodes': self.nodes,
+            'qnodes': self.qnodes,
+            'leaf_evals': self.leaf_evals,
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'time': self.time,
+            'nps': self.nodes / self.time if self.time else 0,
+            'cutoffs': list(self.cutoffs),
+            'first_move_cutoff_rate': self.cutoffs[0] / total_cutoffs if total_cutoffs else 0,
+            'null_moves': self.null_moves,
+            'null_cutoffs': self.null_cutoffs,
+            'reductions': self.reductions,
+            're_searches': self.re_searches,
+            'components': components,
+        }
+
+    def dump(self, file=None):
+        # Human readable summary
+        if file is None:
+            file = sys.stdout
+        summary = self.summary()
+        print('searches {searches}  nodes {nodes}  qnodes {qnodes}  leaf evals {leaf_evals}  time {time:.3f}s  '
+              'nps {nps:.0f}'.format(**summary), file=file)
+        print('tt probes {}  hits {}'.format(summary['tt_probes'], summary['tt_hits']), file=file)
+        print('cutoffs by move index {}  (first move {:.0%})'.format(summary['cutoffs'],
+                                                                    summary['first_move_cutoff_rate']), file=file)
+        print('null moves {}  cutoffs {}  reductions {}  re-searches {}'.format(
+            summary['null_moves'], summary['null_cutoffs'], summary['reductions'], summary['re_searches']), file=file)
+        components = sorted(summary['components'].items(), key=lambda item: item[1]['total_s'], reverse=True)
+        for name, row in components:
+            print('  {:<18} {:>9} calls {:>9.1f} us/call {:>8.3f}s'.format(name, row['calls'], row['mean_us'],
+                                                                         row['total_s']), file=file)
+
+# Profiling state shared by every SearchStats: the COMPONENTS are replaced on their classes once, while any
+# profile() block is open, and each call is passed to the SearchStats profiling on the calling thread
+profile_lock = threading.Lock()
+profile_users = 0
+profile_originals = []
+profilers = {}
+
+def profiled(name, function, generator):
+    def wrapper(*args, **kwargs):
+        stack = profilers.get(threading.get_ident())
+        if not stack:
+            return function(*args, **kwargs)
+        return stack[-1].record(name, function, generator, args, kwargs)
+
+    return wrapper
+
+def install_profiling():
+    # Called with profile_lock held, patches the classes for the first user only
+    global profile_users
+    profile_users = profile_users + 1
+    if profile_users > 1:
+        return
+    owners = {'Chess': Chess, 'TranspositionTable': TranspositionTable, 'Board': chess.Board}
+    for name, (owner_name, attribute) in SearchStats.COMPONENTS.items():
+        owner = owners[owner_name]
+        raw = owner.__dict__[attribute]
+        wrapper = profiled(name, getattr(owner, attribute), attribute == 'generate_legal_moves')
+        if isinstance(raw, staticmethod):
+            wrapper = staticmethod(wrapper)
+        profile_originals.append((owner, attribute, raw))
+        setattr(owner, attribute, wrapper)
+
+def uninstall_profiling():
+    # Called with profile_lock held, puts the original functions back when the last user is done
+    global profile_users
+    profile_users = profile_users - 1
+    if profile_users > 0:
+        return
+    for owner, attribute, raw in profile_originals:
+        setattr(owner, attribute, raw)
+    del profile_originals[:]
+
+def order_moves(engine, moves, first, state):
+    """
+    Sort moves so that cutoffs are found early:
+        first (TT move / previous best move), captures by MVV-LVA, promotions, killer moves, the rest by history
+    :return: list of moves
+    """
+    board = engine.board
+    ply = state.ply(engine)
+    killers = state.killers[ply] if ply < MAX_PLY else (None, None)
+    color_offset = int(board.turn) * 4096
+    history = state.history
+    scored = []
+    for move in moves:
+        if move == first:
+            score = ORDER_FIRST
+        elif board.is_capture(move):
+            if board.is_en_passant(move):
+                victim = chess.PAWN
+            else:
+                victim = board.piece_type_at(move.to_square)
+            attacker = board.piece_type_at(move.from_square)
+            # Most valuable victim first, least valuable attacker breaks ties
+            score = ORDER_CAPTURE + 10 * PV[chess.piece_name(victim)] - PV[chess.piece_name(attacker)]
+            if move.promotion:
+                score = score + PV[chess.piece_name(move.promotion)]
+        elif move.promotion:
+            score = ORDER_PROMOTION + PV[chess.piece_name(move.promotion)]
+        elif move == killers[0]:
+            score = ORDER_KILLER + 1
+        elif move == killers[1]:
+            score = ORDER_KILLER
+        else:
+            score = min(history[color_offset + move.from_square * 64 + move.to_square], ORDER_KILLER - 1)
+        scored.append((score, move))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [move for score, move in scored]
+
+def capture_gain(board, move):
+    # Material a capture or promotion wins, before any recapture
+    gain = 0
+    if board.is_en_passant(move):
+        gain = PV['pawn']
+    else:
+        victim = board.piece_type_at(move.to_square)
+        if victim is not None:
+            gain = PV[chess.piece_name(victim)]
+    if move.promotion:
+        gain = gain + PV[chess.piece_name(move.promotion)] - PV['pawn']
+    return gain
+
+def see(board, move):
+    """
+    Static exchange evaluation: material won by the side to move if both sides keep recapturing on the target
+    square with their least valuable piece and may stop whenever that is better for them.
+    :return: material balance of the exchange in PV units, from the point of view of the side making the move
+    """
+    target = move.to_square
+    gains = [capture_gain(board, move)]
+    occupied = board.occupied & ~chess.BB_SQUARES[move.from_square]
+    if board.is_en_passant(move):
+        occupied = occupied & ~chess.BB_SQUARES[target + (-8 if board.turn == W else 8)]
+    if move.promotion:
+        on_target = PV[chess.piece_name(move.promotion)]
+    else:
+        on_target = PV[chess.piece_name(board.piece_type_at(move.from_square))]
+    side = not board.turn
+    while True:
+        attackers = board.attackers_mask(side, target, occupied) & occupied
+        if not attackers:
+            break
+        for piece_type in chess.PIECE_TYPES:
+            candidates = attackers & board.pieces_mask(piece_type, side)
+            if candidates:
+                square = chess.lsb(candidates)
+                break
+        if piece_type == chess.KING and board.attackers_mask(not side, target, occupied) & occupied & \
+                ~chess.BB_SQUARES[square]:
+            # The king can't take a defended piece
+            break
+        gains.append(on_target - gains[-1])
+        on_target = PV[chess.piece_name(piece_type)]
+        occupied = occupied & ~chess.BB_SQUARES[square]
+        side = not side
+    # Each side only continues the exchange if it is better than stopping
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+def quiescence(engine, alpha=-math.inf, beta=math.inf, state=None, qdepth=0):
+    """
+    Search captures and promotions only until the position is quiet, so leaves are not scored in the middle of an
+    exchange. The side to move can always stand pat (keep the static evaluation) instead of capturing, except
+    when in check, where every evasion is searched.
+
+    :param state: SearchState with the limits and switches, a default one if None
+    :param qdepth: plies of captures played since the leaf, 0 when called from the main search
+    :return: score from white's point of view
+    """
+    if state is None:
+        state = SearchState()
+    if qdepth == 0:
+        state.q_limit = state.qnodes + state.q_node_cap
+    else:
+        # The leaf itself has already been counted by the main search
+        if state.tick():
+            return 0
+    state.qnodes = state.qnodes + 1
+    board = engine.board
+    white = board.turn == W
+
+    in_check = board.is_check()
+    if in_check:
+        moves = list(board.legal_moves)
+        if not moves:
+            mate = MATE - state.ply(engine)
+            return -mate if white else mate
+        if qdepth >= state.q_max_depth or state.qnodes >= state.q_limit:
+            return engine.evaluate()
+        best = -math.inf if white else math.inf
+        stand = None
+    else:
+        stand = engine.evaluate()
+        if qdepth >= state.q_max_depth or state.qnodes >= state.q_limit:
+            return stand
+        if white:
+            if stand >= beta:
+                return stand
+            alpha = max(alpha, stand)
+        else:
+            if stand <= alpha:
+                return stand
+            beta = min(beta, stand)
+        best = stand
+        moves = list(board.generate_legal_captures())
+        # Promotions that don't capture
+        if white:
+            promoting = board.pawns & board.occupied_co[W] & chess.BB_RANK_7
+        else:
+            promoting = board.pawns & board.occupied_co[B] & chess.BB_RANK_2
+        if promoting:
+            moves = moves + list(board.generate_legal_moves(promoting, ~board.occupied))
+    moves = order_moves(engine, moves, None, state)
+
+    for move in moves:
+        if stand is not None:
+            # Delta pruning: even winning the piece for free doesn't bring the score back into the window
+            gain = capture_gain(board, move)
+            if white and stand + gain + DELTA_MARGIN < alpha:
+                continue
+            if not white and stand - gain - DELTA_MARGIN > beta:
+                continue
+            if state.see_filter and board.is_capture(move) and see(board, move) < 0:
+                continue
+        engine.push(move)
+        score = quiescence(engine, alpha, beta, state, qdepth + 1)
+        engine.pop()
+        if state.stopped:
+            return 0
+        if white:
+            if score > best:
+                best = score
+            alpha = max(alpha, score)
+        else:
+            if score < best:
+                best = score
+            beta = min(beta, score)
+        if beta <= alpha:
+            break
+    return best
+
+def move_first(moves, first):
+    # Put first at the front of moves if it is one of them
+    if first is None or first not in moves:
+        return moves
+    return [first] + [move for move in moves if move != first]
+
+def basic_alpha_beta(engine, depth=3, alpha=-math.inf, beta=math.inf, tt=None, make_unmake=False, state=None,
+                     root=True):
+    """
+    :param tt: optional TranspositionTable shared by the whole search
+    :param make_unmake: push and pop moves on engine.board instead of deep copying a child per move
+    :param state: optional SearchState to count nodes and stop on its limits. Once state.stopped is set the
+                  returned values are meaningless and the caller has to throw them away.
+    """
     best_move = None
     next_move = None
+    if state is not None and state.tick():
+        return 0, None
     if engine.board.is_checkmate():
         if engine.color == W:
-            eval = int(-10000000)
+            eval = int(-MATE)
         else:
-            eval = int(10000000)
+            eval = int(MATE)
         return eval, None
     if engine.is_draw():
         return 0, None
+    # The root of a search with a state is left to iterative_deepening, which also needs the move. Below the root
+    # only the score is used, so the move (one probe per legal move) is only looked up at the root.
+    if engine.tablebase is not None and (state is None or not root):
+        score = engine.tablebase_score()
+        if score is not None:
+            return score, engine.tablebase_move() if root else None
     if depth == 0:
         # print(engine.board)
         # print(engine.evaluate())
+        if state is not None and state.stats is not None:
+            state.stats.leaf_evals = state.stats.leaf_evals + 1
+        if state is not None and state.quiescence:
+            return quiescence(engine, alpha, beta, state), None
         return engine.evaluate(), None
+    alpha_orig = alpha
+    beta_orig = beta
+    first = None
+    if tt is not None:
+        key = tt.hash(engine.board)
+        entry = tt.probe(key)
+        if entry is not None:
+            if entry[1] >= depth:
+                score, bound = entry[2], entry[3]
+                if bound == EXACT:
+                    return score, entry[4]
+                if bound == LOWER and score >= beta:
+                    return score, entry[4]
+                if bound == UPPER and score <= alpha:
+                    return score, entry[4]
+            # Not deep enough to use the score, but the move is still the best guess
+            first = entry[4]
+    if state is not None and len(engine.board.move_stack) == state.root_ply and state.root_move is not None:
+        first = state.root_move
+    moves = engine.board.legal_moves
+    if state is not None and state.order_moves:
+        moves = order_moves(engine, moves, first, state)
+    elif make_unmake or first is not None:
+        # The generator reads the live board, so take the moves out before pushing anything
+        moves = move_first(list(moves), first)
     if engine.color == W:
         max_eval = -math.inf
-        moves = engine.board.legal_moves
-        for move in moves:
-            child = engine.get_child(move)
-            # print(child.board)
-            eval, next_move = basic_alpha_beta(child, depth-1, alpha, math.inf)
+        for i, move in enumerate(moves):
+            if make_unmake:
+                engine.push(move)
+                eval, next_move = basic_alpha_beta(engine, depth-1, alpha, math.inf, tt, make_unmake, state, False)
+                engine.pop()
+            else:
+                child = engine.get_child(move)
+                # print(child.board)
+                eval, next_move = basic_alpha_beta(child, depth-1, alpha, math.inf, tt, state=state, root=False)
+            if state is not None and state.stopped:
+                return 0, None
             alpha = max(alpha, eval)
             # print(move, eval, best_move, max_eval)
             if eval > max_eval:
                 max_eval = eval
                 best_move = move
             if beta <= alpha:
+                if state is not None:
+                    state.cutoff(engine, move, depth, i)
                 break
+        if tt is not None:
+            tt.store(key, depth, max_eval, tt_bound(max_eval, alpha_orig, beta_orig), best_move)
         return max_eval, best_move
     else:
         min_eval = math.inf
-        moves = engine.board.legal_moves
-        for move in moves:
-            child = engine.get_child(move)
-            eval, next_move = basic_alpha_beta(child, depth-1, -math.inf, beta)
+        for i, move in enumerate(moves):
+            if make_unmake:
+                engine.push(move)
+                eval, next_move = basic_alpha_beta(engine, depth-1, -math.inf, beta, tt, make_unmake, state, False)
+                engine.pop()
+            else:
+                child = engine.get_child(move)
+                eval, next_move = basic_alpha_beta(child, depth-1, -math.inf, beta, tt, state=state, root=False)
+            if state is not None and state.stopped:
+                return 0, None
             beta = min(beta, eval)
             if eval < min_eval:
                 min_eval = eval
                 best_move = move
             if beta <= alpha:
+                if state is not None:
+                    state.cutoff(engine, move, depth, i)
                 break
+        if tt is not None:
+            tt.store(key, depth, min_eval, tt_bound(min_eval, alpha_orig, beta_orig), best_move)
         return min_eval, best_move
 
-# flag = 1
-engine = Chess('rnbqkbnr/1pppp1pp/8/p7/4P3/1B3Q2/PPPP1PPP/RNB1K1NR w KQkq - 0 1')
-engine.color = W
-eval, move = basic_alpha_beta(engine, 3, -math.inf, math.inf)
-print(move)
-# while flag:
-#     eval, move = basic_alpha_beta(engine, 3, -math.inf, math.inf)
-#     print(move)
-#     engine.board.push(move)
-#     print(engine.board)
-#     print(engine.board.legal_moves)
-#     i = int(input())
-#     j = int(0)
-#     for move in engine.board.legal_moves:
-#         if j == i:
-#             engine.board.push(move)
-#             break
-#         j=j+1
-
-    
+def flip_bound(bound):
+    # Bound seen from the other side (a lower bound for white is an upper bound for black)
+    if bound == LOWER:
+        return UPPER
+    if bound == UPPER:
+        return LOWER
+    return bound
+
+def pvs(engine, depth, alpha=-math.inf, beta=math.inf, state=None, tt=None):
+    """
+    Negamax principal variation search: the first move is searched with the full window, the others with a null
+    window around alpha and searched again with the full window only if they turn out better. Always pushes and
+    pops on engine.board.
+
+    :param state: SearchState with the limits, switches and ordering tables, a default one if None
+    :param tt: optional TranspositionTable, entries are stored from white's point of view like basic_alpha_beta's
+    :return: (score from the point of view of the side to move, principal variation as a list of moves)
+    """
+    if state is None:
+        state = SearchState()
+        state.root_ply = len(engine.board.move_stack)
+    if state.tick():
+        return 0, []
+    board = engine.board
+    white = board.turn == W
+    ply = state.ply(engine)
+    # Mates and tablebase wins are scored by their distance from the root, so shorter ones are preferred and
+    # the distance can be read back from the score
+    if board.is_checkmate():
+        return -(MATE - ply), []
+    if engine.is_draw():
+        return 0, []
+    if engine.tablebase is not None and ply > 0:
+        score = engine.tablebase_score()
+        if score is not None:
+            # The table counts the plies from this position, the search from the root
+            return score_from_tt(score if white else -score, ply), []
+    if depth <= 0:
+        if state.stats is not None:
+            state.stats.leaf_evals = state.stats.leaf_evals + 1
+        if state.quiescence:
+            if white:
+                return quiescence(engine, alpha, beta, state), []
+            return -quiescence(engine, -beta, -alpha, state), []
+        if white:
+            return engine.evaluate(), []
+        return -engine.evaluate(), []
+
+    alpha_orig = alpha
+    first = None
+    if tt is not None:
+        key = tt.hash(board)
+        entry = tt.probe(key)
+        if entry is not None:
+            # No cutoffs at the root or in PV nodes (full window), they would cut the principal variation short
+            if entry[1] >= depth and entry[4] is not None and ply > 0 and beta - alpha <= NULL_WINDOW:
+                score, bound = entry[2], entry[3]
+                if not white:
+                    score, bound = -score, flip_bound(bound)
+                score = score_from_tt(score, ply)
+                if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                    return score, [entry[4]]
+            first = entry[4]
+    in_check = board.is_check()
+    # Null move: if passing still fails high with a reduced search, a real move will too. Only in null window
+    # nodes, never twice in a row, and not when the side to move has only pawns left (zugzwang).
+    if (state.null_move and depth >= NULL_MOVE_MIN_DEPTH and beta - alpha <= NULL_WINDOW and ply > 0
+            and not in_check and board.move_stack[-1] != chess.Move.null()
+            and not engine.only_king_and_pawns(board.turn)):
+        engine.push(chess.Move.null())
+        score, child_pv = pvs(engine, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + NULL_WINDOW, state, tt)
+        engine.pop()
+        score = -score
+        if state.stats is not None:
+            state.stats.null_moves = state.stats.null_moves + 1
+        if state.stopped:
+            return 0, []
+        if score >= beta:
+            if state.stats is not None:
+                state.stats.null_cutoffs = state.stats.null_cutoffs + 1
+            # A mate found after passing isn't a real mate
+            return (beta if score >= TB_WIN else score), []
+
+    if len(board.move_stack) == state.root_ply and state.root_move is not None:
+        first = state.root_move
+    if state.order_moves:
+        moves = order_moves(engine, board.legal_moves, first, state)
+    else:
+        moves = move_first(list(board.legal_moves), first)
+    killers = state.killers[ply] if ply < MAX_PLY else (None, None)
+
+    best = -math.inf
+    best_move = None
+    best_pv = []
+    for i, move in enumerate(moves):
+        # Late quiet moves rarely turn out best, search them shallower first
+        reduce = (state.lmr and i >= LMR_MIN_MOVES and depth >= LMR_MIN_DEPTH and not in_check
+                  and not move.promotion and move not in killers and not board.is_capture(move)
+                  and not board.gives_check(move))
+        engine.push(move)
+        if i == 0:
+            score, child_pv = pvs(engine, depth - 1, -beta, -alpha, state, tt)
+            score = -score
+        else:
+            score = None
+            if reduce:
+                score, child_pv = pvs(engine, depth - 1 - LMR_REDUCTION, -alpha - NULL_WINDOW, -alpha, state, tt)
+                score = -score
+                if state.stats is not None:
+                    state.stats.reductions = state.stats.reductions + 1
+                if score > alpha and not state.stopped:
+                    # Better than expected: search it again at full depth
+                    if state.stats is not None:
+                        state.stats.re_searches = state.stats.re_searches + 1
+                    score = None
+            if score is None:
+                score, child_pv = pvs(engine, depth - 1, -alpha - NULL_WINDOW, -alpha, state, tt)
+                score = -score
+                if alpha < score < beta and not state.stopped:
+                    score, child_pv = pvs(engine, depth - 1, -beta, -alpha, state, tt)
+                    score = -score
+        engine.pop()
+        if state.stopped:
+            return 0, []
+        if score > best:
+            best = score
+            best_move = move
+            best_pv = [move] + child_pv
+        if score > alpha:
+            alpha = score
+        if alpha >= beta:
+            state.cutoff(engine, move, depth, i)
+            break
+
+    if tt is not None:
+        bound = tt_bound(best, alpha_orig, beta)
+        stored = score_to_tt(best, ply)
+        if white:
+            tt.store(key, depth, stored, bound, best_move)
+        else:
+            tt.store(key, depth, -stored, flip_bound(bound), best_move)
+    return best, best_pv
+
+def tt_pv(engine, tt, max_length):
+    # Follow the best moves stored in the transposition table from the current position
+    board = engine.board.copy()
+    pv = []
+    while len(pv) < max_length:
+        entry = tt.probe(tt.hash(board))
+        if entry is None or entry[4] is None or not board.is_legal(entry[4]):
+            break
+        pv.append(entry[4])
+        board.push(entry[4])
+    return pv
+
+def search_root(engine, depth, previous, state, tt, aspiration):
+    """
+    One PVS iteration at the root with an aspiration window around the previous iteration's score, widened and
+    searched again whenever the score falls outside of it.
+    :param previous: score of the previous iteration from the side to move's point of view, None for no window
+    """
+    if previous is None or aspiration is None or abs(previous) >= MATE - MAX_PLY:
+        return pvs(engine, depth, -math.inf, math.inf, state, tt)
+    delta = aspiration
+    alpha = previous - delta
+    beta = previous + delta
+    while True:
+        score, pv = pvs(engine, depth, alpha, beta, state, tt)
+        if state.stopped:
+            return score, pv
+        if score <= alpha:
+            delta = delta * 4
+            alpha = -math.inf if delta > 16 * aspiration else score - delta
+        elif score >= beta:
+            delta = delta * 4
+            beta = math.inf if delta > 16 * aspiration else score + delta
+        else:
+            return score, pv
+
+def iterative_deepening(engine, max_depth=64, time_limit=None, node_limit=None, tt=None, make_unmake=True,
+                        search='pvs', aspiration=ASPIRATION_WINDOW, on_iteration=None, on_start=None, **options):
+    """
+    Search depth 1, 2, 3, ... until max_depth or a limit is reached. The transposition table and the previous best
+    move (searched first at the root) let every iteration start from the last one's result.
+
+    :param time_limit: seconds for the whole search
+    :param node_limit: nodes for the whole search
+    :param tt: TranspositionTable to use, a new one if None
+    :param make_unmake: see basic_alpha_beta, pvs always makes and unmakes moves
+    :param search: 'pvs' for pvs with aspiration windows, 'alpha_beta' for basic_alpha_beta
+    :param aspiration: half width of the aspiration window, None to always search with a full window
+    :param on_iteration: called with (eval, best_move, info) after every completed iteration
+    :param on_start: called with the SearchState before the first iteration, e.g. to stop() it from another thread
+    :param options: search switches passed on to SearchState (order_moves, quiescence, see_filter, stats). With
+                    stats the search's counters are added to that SearchStats, and its components are timed.
+    :return: (eval, best_move, info) of the deepest completed iteration, eval is from white's point of view and
+             info has 'depth', 'nodes', 'time' and 'pv' (list of moves). When a limit stops depth 1 the first legal
+             move is returned with the static evaluation and depth 0. A book or tablebase move is returned at once
+             with depth 0 and 'book' or 'tablebase' set in info.
+    """
+    if search not in ('pvs', 'alpha_beta'):
+        raise ValueError('unknown search {!r}'.format(search))
+    book_move = engine.book_move()
+    if book_move is not None:
+        return engine.evaluate(), book_move, {'depth': 0, 'nodes': 0, 'time': 0.0, 'pv': [book_move], 'book': True}
+    tablebase_move = engine.tablebase_move()
+    if tablebase_move is not None:
+        return engine.tablebase_score(), tablebase_move, {'depth': 0, 'nodes': 0, 'time': 0.0,
+                                                          'pv': [tablebase_move], 'tablebase': True}
+    if tt is None:
+        tt = TranspositionTable()
+    state = SearchState(time_limit, node_limit, **options)
+    state.root_ply = len(engine.board.move_stack)
+    if on_start is not None:
+        on_start(state)
+    sign = 1 if engine.board.turn == W else -1
+    best_eval, best_move, best_pv, completed = None, None, [], 0
+    stats = state.stats
+    tt_probes = tt.hits + tt.misses
+    tt_hits = tt.hits
+    profile = stats.profile() if stats is not None else nullcontext()
+    with profile:
+        for depth in range(1, max_depth + 1):
+            state.root_move = best_move
+            if search == 'pvs':
+                previous = None if best_eval is None else sign * best_eval
+                score, pv = search_root(engine, depth, previous, state, tt, aspiration)
+                eval = sign * score
+                move = pv[0] if pv else None
+            else:
+                eval, move = basic_alpha_beta(engine, depth, tt=tt, make_unmake=make_unmake, state=state)
+                pv = tt_pv(engine, tt, depth) if move is not None else []
+                if pv[:1] != [move]:
+                    pv = [move]
+            if state.stopped:
+                break
+            best_eval, best_move, best_pv, completed = eval, move, pv, depth
+            if on_iteration is not None:
+                on_iteration(eval, move, {'depth': depth, 'nodes': state.nodes, 'time': state.elapsed(), 'pv': pv})
+            # Game over at the root, or a forced mate found: searching deeper won't change the move
+            if move is None or abs(eval) >= MATE - MAX_PLY:
+                break
+            # The next iteration takes several times longer than all the previous ones, don't start what can't finish
+            if state.deadline is not None and time.perf_counter() - state.limit_start > state.time_limit / 2:
+                break
+    if best_move is None and state.stopped:
+        # Out of time or nodes before depth 1 finished: any legal move beats none
+        best_move = next(iter(engine.board.legal_moves), None)
+        if best_move is not None:
+            best_eval, best_pv = engine.evaluate(), [best_move]
+    if stats is not None:
+        stats.add_search(state, tt.hits + tt.misses - tt_probes, tt.hits - tt_hits)
+    info = {'depth': completed, 'nodes': state.nodes, 'time': state.elapsed(), 'pv': best_pv}
+    return best_eval, best_move, info
+
+class Ponderer:
+    def __init__(self, engine, max_depth=4, time_limit=None, tt=None, **options):
+        """
+        Plays one side of a game on engine. The transposition table and the history table are kept for the whole
+        game, and while the opponent thinks the position after the expected reply is searched in a background
+        thread. If the opponent plays that move, think() continues the running search instead of starting over.
+
+        :param max_depth: depth of every search
+        :param time_limit: seconds per move, None to always search to max_depth
+        :param tt: TranspositionTable for the game, a new one if None
+        :param options: passed on to iterative_deepening (search, aspiration, order_moves, null_move, ...)
+        """
+        self.engine = engine
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.options = options
+        self.history = [0] * (2 * 64 * 64)
+        self.thread = None
+        self.state = None
+        self.started = threading.Event()
+        self.result = None
+        # Reply the background search assumes, and the position it searches
+        self.expected = None
+        self.ponder_fen = None
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+
+    def run(self, engine, time_limit):
+        def on_start(state):
+            self.state = state
+            self.started.set()
+
+        try:
+            self.result = iterative_deepening(engine, max_depth=self.max_depth, time_limit=time_limit, tt=self.tt,
+                                              on_start=on_start, history=self.history, **self.options)
+        finally:
+            # Book and tablebase moves return without starting a search
+            self.started.set()
+
+    def think(self):
+        """
+        Search the current position of engine
+        :return: (eval, best_move, info) as iterative_deepening, info has 'ponder_hit' set when the background
+                 search was on this position
+        """
+        board = self.engine.board
+        hit = self.thread is not None and self.ponder_fen == board.fen() and board.peek() == self.expected
+        if hit:
+            self.ponder_hits = self.ponder_hits + 1
+            self.started.wait()
+            if self.time_limit is not None and self.state is not None:
+                self.state.set_time_limit(self.time_limit)
+            self.thread.join()
+            self.thread = None
+        else:
+            if self.thread is not None:
+                self.ponder_misses = self.ponder_misses + 1
+            self.stop()
+            # Older cutoffs count less than the ones of this search
+            self.history[:] = [value // 2 for value in self.history]
+            self.run(copy.deepcopy(self.engine), self.time_limit)
+        self.state = None
+        eval, move, info = self.result
+        info['ponder_hit'] = hit
+        return eval, move, info
+
+    def ponder(self):
+        """
+        Call once the move think() returned is played on engine: starts searching the expected reply from the
+        principal variation, until the next think() or stop()
+        """
+        self.stop()
+        if self.result is None or len(self.result[2]['pv']) < 2 or not self.engine.board.move_stack:
+            return
+        pv = self.result[2]['pv']
+        if self.engine.board.peek() != pv[0] or not self.engine.board.is_legal(pv[1]):
+            return
+        self.expected = pv[1]
+        child = copy.deepcopy(self.engine)
+        child.push(self.expected)
+        self.ponder_fen = child.board.fen()
+        self.started.clear()
+        self.state = None
+        self.thread = threading.Thread(target=self.run, args=(child, None), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.started.wait()
+        if self.state is not None:
+            self.state.stop()
+        self.thread.join()
+        self.thread = None
+        self.state = None
+
+# Transposition table of a parallel_search worker process, kept between the root moves it is given
+worker_tt = None
+
+def search_root_move(task):
+    """
+    Worker side of parallel_search: rebuild the position, play the root move and search it
+    :param task: (root fen, moves in uci from that fen up to and including the root move, depth, alpha, beta,
+                  incremental, evaluator, SearchState options)
+    :return: (eval, nodes)
+    """
+    global worker_tt
+    root_fen, moves, depth, alpha, beta, incremental, evaluator, options = task
+    if worker_tt is None:
+        worker_tt = TranspositionTable()
+    engine = Chess(root_fen, incremental=incremental, evaluator=evaluator)
+    for uci in moves:
+        engine.push(chess.Move.from_uci(uci))
+    state = SearchState(**options)
+    state.root_ply = len(engine.board.move_stack)
+    eval, move = basic_alpha_beta(engine, depth, alpha, beta, tt=worker_tt, make_unmake=True, state=state)
+    return eval, state.nodes
+
+def parallel_search(engine, depth=4, workers=None, pool=None, **options):
+    """
+    Root split search over a process pool. The best ordered root move is searched first to get a bound, then
+    the other root moves are searched in parallel with that bound. Every worker keeps its own transposition table.
+
+    :param workers: number of processes, os.cpu_count() if None (ignored when pool is given)
+    :param pool: concurrent.futures.ProcessPoolExecutor to reuse between calls
+    :param options: search switches passed on to SearchState (order_moves, quiescence, see_filter)
+    :return: (eval, best_move, info), info has 'depth', 'nodes', 'time' and 'workers'
+    """
+    start = time.perf_counter()
+    board = engine.board
+    if depth < 1 or board.is_game_over(claim_draw=False) or engine.is_draw():
+        eval, move = basic_alpha_beta(engine, depth)
+        return eval, move, {'depth': depth, 'nodes': 1, 'time': time.perf_counter() - start, 'workers': 0}
+
+    order_state = SearchState()
+    order_state.root_ply = len(board.move_stack)
+    moves = order_moves(engine, board.legal_moves, None, order_state)
+    root_fen = board.root().fen()
+    history = [move.uci() for move in board.move_stack]
+    incremental = engine.incremental is not None
+    white = engine.color == W
+
+    def task(move, alpha, beta):
+        return root_fen, history + [move.uci()], depth - 1, alpha, beta, incremental, engine.evaluator, options
+
+    own_pool = pool is None
+    if own_pool:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        pool = ProcessPoolExecutor(workers)
+    try:
+        best_eval, nodes = pool.submit(search_root_move, task(moves[0], -math.inf, math.inf)).result()
+        best_move = moves[0]
+        if white:
+            tasks = [task(move, best_eval, math.inf) for move in moves[1:]]
+        else:
+            tasks = [task(move, -math.inf, best_eval) for move in moves[1:]]
+        for move, (eval, move_nodes) in zip(moves[1:], pool.map(search_root_move, tasks)):
+            nodes = nodes + move_nodes
+            if (white and eval > best_eval) or (not white and eval < best_eval):
+                best_eval = eval
+                best_move = move
+    finally:
+        if own_pool:
+            pool.shutdown()
+    info = {'depth': depth, 'nodes': nodes + 1, 'time': time.perf_counter() - start, 'workers': workers}
+    return best_eval, best_move, info
+
+def tt_bound(score, alpha, beta):
+    # Scores are always from white's point of view, so the same rule works for both sides
+    if score <= alpha:
+        return UPPER
+    if score >= beta:
+        return LOWER
+    return EXACT
+
+if __name__ == "__main__":
+    # flag = 1
+    engine = Chess('rnbqkbnr/1pppp1pp/8/p7/4P3/1B3Q2/PPPP1PPP/RNB1K1NR w KQkq - 0 1')
+    engine.color = W
+    eval, move = basic_alpha_beta(engine, 3, -math.inf, math.inf)
+    print(move)
+    # while flag:
+    #     eval, move = basic_alpha_beta(engine, 3, -math.inf, math.inf)
+    #     print(move)
+    #     engine.board.push(move)
+    #     print(engine.board)
+    #     print(engine.board.legal_moves)
+    #     i = int(input())
+    #     j = int(0)
+    #     for move in engine.board.legal_moves:
+    #         if j == i:
+    #             engine.board.push(move)
+    #             break
+    #         j=j+1
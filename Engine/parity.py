@@ -0,0 +1,74 @@
+import argparse
+import math
+import random
+import sys
+import chess
+from my_engine import *
+
+# Hand picked positions: the ones used in my_engine.py, the usual perft test positions and a few endgames
+FENS = [
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'rnbqkbnr/1pppp1pp/8/p7/4P3/1B3Q2/PPPP1PPP/RNB1K1NR w KQkq - 0 1',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+    'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+    'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+    'r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4',
+    'rnbqkb1r/pp2pp1p/3p1np1/8/3NP3/2N5/PPP2PPP/R1BQKB1R w KQkq - 0 6',
+    'r1bq1rk1/pp2ppbp/2np1np1/8/3NP3/2N1BP2/PPPQ2PP/R3KB1R w KQ - 3 9',
+    '8/8/4k3/8/8/4K3/4P3/8 w - - 0 1',
+    '8/8/8/8/8/2k5/8/KQ6 b - - 0 1',
+    '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1',
+    '4k3/PP6/8/8/8/8/6pp/4K3 w - - 0 1',
+]
+
+
+def random_positions(count, seed=0, max_plies=120):
+    # Positions from random games, to cover promotions, castling and odd piece placements
+    rng = random.Random(seed)
+    fens = []
+    while len(fens) < count:
+        board = chess.Board()
+        for ply in range(rng.randint(1, max_plies)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+        fens.append(board.fen())
+    return fens
+
+
+def check_parity(fens, evaluator='bitboard'):
+    """
+    :return: list of (fen, evaluate() with the 'squares' evaluator, evaluate() with the given evaluator)
+             for every position where the two differ
+    """
+    mismatches = []
+    for fen in fens:
+        expected = Chess(fen).evaluate()
+        value = Chess(fen, evaluator=evaluator).evaluate()
+        if math.isinf(expected) or math.isinf(value):
+            same = expected == value
+        else:
+            same = math.isclose(expected, value, rel_tol=1e-9, abs_tol=1e-6)
+        if not same:
+            mismatches.append((fen, expected, value))
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check an evaluator backend against the square by square evaluate()')
+    # 'tapered' uses different terms, only the backends of the same evaluation can be compared
+    parser.add_argument('--evaluator', default='bitboard', choices=('squares', 'bitboard'))
+    parser.add_argument('--random', type=int, default=2000, help='number of random game positions to add')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fens = FENS + random_positions(args.random, args.seed)
+    mismatches = check_parity(fens, args.evaluator)
+    for fen, expected, value in mismatches:
+        print('{}: squares {} {} {}'.format(fen, expected, args.evaluator, value))
+    print('{} positions, {} mismatches'.format(len(fens), len(mismatches)))
+    if mismatches:
+        sys.exit(1)
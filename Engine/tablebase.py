@@ -0,0 +1,213 @@
+import argparse
+import os
+import time
+import chess
+from my_engine import *
+
+# Tables built when no signature is given, in dependency order (a pawn promotes into the queen and rook tables)
+DEFAULT_TABLES = ['KQvK', 'KRvK', 'KPvK']
+# Marks a legal position whose value isn't known yet while generating
+TB_UNKNOWN = 254
+MAX_PLIES = TB_LOSS - 2
+
+
+def decode(index, count):
+    # Table index -> (side to move, list of squares in table order)
+    squares = []
+    for i in range(count):
+        squares.append(index % 64)
+        index = index // 64
+    squares.reverse()
+    return (W if index == 0 else B), squares
+
+
+def encode(turn, squares, order):
+    # Squares of identical pieces are kept sorted, so every placement has one index
+    squares = list(squares)
+    i = 0
+    while i < len(order):
+        j = i
+        while j < len(order) and order[j] == order[i]:
+            j = j + 1
+        squares[i:j] = sorted(squares[i:j])
+        i = j
+    index = 0 if turn == W else 1
+    for square in squares:
+        index = index * 64 + square
+    return index
+
+
+def make_board(turn, squares, order):
+    if len(set(squares)) != len(squares):
+        return None
+    board = chess.Board.empty()
+    for (color, piece_type), square in zip(order, squares):
+        if piece_type == chess.PAWN and chess.square_rank(square) in (0, 7):
+            return None
+        board.set_piece_at(square, chess.Piece(piece_type, color))
+    board.turn = turn
+    if not board.is_valid():
+        return None
+    return board
+
+
+def attacks(piece_type, square, occupied):
+    if piece_type == chess.KING:
+        return chess.BB_KING_ATTACKS[square]
+    if piece_type == chess.KNIGHT:
+        return chess.BB_KNIGHT_ATTACKS[square]
+    mask = 0
+    if piece_type in (chess.BISHOP, chess.QUEEN):
+        mask = mask | chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+    if piece_type in (chess.ROOK, chess.QUEEN):
+        mask = (mask | chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] |
+                chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied])
+    return mask
+
+
+def unmoves(color, piece_type, square, occupied):
+    # Squares a piece of color could have come from to reach square without capturing or promoting
+    if piece_type != chess.PAWN:
+        return chess.SquareSet(attacks(piece_type, square, occupied) & ~occupied)
+    step = -8 if color == W else 8
+    rank = chess.square_rank(square)
+    relative_rank = rank if color == W else 7 - rank
+    sources = []
+    if relative_rank >= 2 and not occupied & chess.BB_SQUARES[square + step]:
+        sources.append(square + step)
+        if relative_rank == 3 and not occupied & chess.BB_SQUARES[square + 2 * step]:
+            sources.append(square + 2 * step)
+    return sources
+
+
+def predecessors(index, order):
+    # Positions one move before index, with the other side to move and no capture or promotion in between
+    turn, squares = decode(index, len(order))
+    mover = not turn
+    occupied = 0
+    for square in squares:
+        occupied = occupied | chess.BB_SQUARES[square]
+    for i, (color, piece_type) in enumerate(order):
+        if color != mover:
+            continue
+        for source in unmoves(color, piece_type, squares[i], occupied):
+            before = list(squares)
+            before[i] = source
+            yield encode(mover, before, order)
+
+
+def generate(name, tablebase, log=None):
+    """
+    Retrograde analysis of one endgame: every legal position is set up once to count its moves and look up the
+    moves that leave the table (captures and promotions) in the tables built before. Then mates are propagated
+    backwards ply by ply, a position is lost when all its moves lead to wins for the other side.
+
+    :param tablebase: Tablebase with the tables captures and promotions lead to
+    :return: bytearray of the table
+    """
+    order = Tablebase.pieces(name)
+    size = 2 * 64 ** len(order)
+    if len(order) > 3 and log is not None:
+        log('{}: {} positions, this takes a while in Python'.format(name, size))
+    values = bytearray([TB_ILLEGAL]) * size
+    # Moves inside the table not yet known to lose, 255 for positions that can't be lost anymore
+    remaining = bytearray(size)
+    # Longest loss over the moves known to lose so far
+    loss_plies = bytearray(size)
+    # Positions to resolve at every ply: (index, win)
+    pending = [[] for i in range(MAX_PLIES + 2)]
+
+    for index in range(size):
+        turn, squares = decode(index, len(order))
+        board = make_board(turn, squares, order)
+        if board is None:
+            continue
+        values[index] = TB_UNKNOWN
+        moves = list(board.legal_moves)
+        if not moves:
+            if board.is_check():
+                pending[0].append((index, False))
+            else:
+                values[index] = TB_DRAW
+            continue
+        inside, blocked, best_win, longest_loss = 0, False, None, 0
+        for move in moves:
+            if not board.is_capture(move) and not move.promotion:
+                inside = inside + 1
+                continue
+            board.push(move)
+            if board.is_checkmate():
+                result = (-1, 0)
+            elif board.is_insufficient_material() or board.is_stalemate():
+                result = (0, 0)
+            else:
+                result = tablebase.probe(board)
+                if result is None:
+                    raise ValueError('{} needs the table of {}'.format(
+                        name, Tablebase.material(board, W) + 'v' + Tablebase.material(board, B)))
+            board.pop()
+            wdl, plies = result
+            if wdl < 0:
+                if best_win is None or plies + 1 < best_win:
+                    best_win = plies + 1
+            elif wdl == 0:
+                blocked = True
+            else:
+                longest_loss = max(longest_loss, plies + 1)
+        if best_win is not None:
+            pending[best_win].append((index, True))
+        if blocked or best_win is not None:
+            remaining[index] = 255
+        else:
+            remaining[index] = inside
+            loss_plies[index] = longest_loss
+            if inside == 0:
+                pending[longest_loss].append((index, False))
+
+    for plies in range(MAX_PLIES + 1):
+        for index, win in pending[plies]:
+            if values[index] != TB_UNKNOWN:
+                continue
+            values[index] = plies if win else TB_LOSS + plies
+            for before in predecessors(index, order):
+                if values[before] != TB_UNKNOWN:
+                    continue
+                if not win:
+                    pending[plies + 1].append((before, True))
+                elif remaining[before] != 255:
+                    remaining[before] = remaining[before] - 1
+                    loss_plies[before] = max(loss_plies[before], plies + 1)
+                    if remaining[before] == 0:
+                        pending[loss_plies[before]].append((before, False))
+    if pending[MAX_PLIES + 1]:
+        raise ValueError('{}: distance to mate over {} plies'.format(name, MAX_PLIES))
+    # Whatever couldn't be resolved is a draw
+    return bytearray(TB_DRAW if value == TB_UNKNOWN else value for value in values)
+
+
+def summary(name, table):
+    wins = sum(1 for value in table if 0 < value < TB_LOSS)
+    losses = sum(1 for value in table if TB_LOSS <= value < TB_ILLEGAL)
+    draws = sum(1 for value in table if value == TB_DRAW)
+    longest = max([value for value in table if 0 < value < TB_LOSS] + [0])
+    return '{}: {} wins, {} draws, {} losses (side to move), longest win {} plies'.format(
+        name, wins, draws, losses, longest)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate endgame tablebases by retrograde analysis')
+    parser.add_argument('signatures', nargs='*', default=DEFAULT_TABLES,
+                        help='tables to build, stronger side first (default: {})'.format(' '.join(DEFAULT_TABLES)))
+    parser.add_argument('-d', '--directory', default='tablebases', help='folder for the .tb files')
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    tablebase = Tablebase(args.directory)
+    for name in args.signatures:
+        start = time.perf_counter()
+        table = generate(name, tablebase, print)
+        path = os.path.join(args.directory, name + '.tb')
+        with open(path, 'wb') as f:
+            f.write(table)
+        tablebase.add(name, table)
+        print('{} ({:.1f}s)'.format(summary(name, table), time.perf_counter() - start))
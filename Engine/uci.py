@@ -0,0 +1,269 @@
+import sys
+import threading
+import chess
+from my_engine import *
+
+NAME = 'SOC chess engine'
+AUTHOR = 'SOC'
+# Moves assumed left in the game when the GUI doesn't send movestogo
+MOVES_TO_GO = 30
+# Seconds kept back from the clock for the GUI and process overhead
+MOVE_OVERHEAD = 0.05
+
+
+def uci_score(eval, turn):
+    # eval is from white's point of view, UCI wants the side to move's. Mates and tablebase wins carry their
+    # distance in plies, UCI counts it in moves.
+    score = eval if turn == W else -eval
+    plies = mate_plies(score)
+    if plies is not None:
+        moves = (plies + 1) // 2
+        return 'mate {}'.format(moves if score > 0 else -moves)
+    return 'cp {}'.format(int(round(score)))
+
+
+def parse_go(tokens):
+    # go depth 5 / go movetime 1000 / go wtime 60000 btime 60000 winc 0 binc 0 movestogo 20 / go nodes 1000 / infinite
+    limits = {}
+    names = ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo', 'nodes')
+    i = 0
+    while i < len(tokens):
+        if tokens[i] in names and i + 1 < len(tokens):
+            limits[tokens[i]] = int(tokens[i + 1])
+            i = i + 2
+        else:
+            if tokens[i] in ('infinite', 'ponder'):
+                limits[tokens[i]] = True
+            i = i + 1
+    return limits
+
+
+def time_for_move(limits, turn):
+    """
+    :param limits: dict from parse_go
+    :return: seconds for this move, None for no time limit
+    """
+    if 'movetime' in limits:
+        return max(limits['movetime'] / 1000 - MOVE_OVERHEAD, 0.01)
+    clock = limits.get('wtime' if turn == W else 'btime')
+    if clock is None:
+        return None
+    increment = limits.get('winc' if turn == W else 'binc', 0)
+    moves_to_go = limits.get('movestogo', MOVES_TO_GO)
+    seconds = clock / 1000 / max(moves_to_go, 1) + increment / 1000 * 0.8
+    return max(min(seconds, clock / 1000 - MOVE_OVERHEAD), 0.01)
+
+
+class UCI:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.lock = threading.Lock()
+        self.hash_mb = 16
+        self.evaluator = 'squares'
+        self.book = None
+        self.tablebase = None
+        self.tt = TranspositionTable(self.hash_mb)
+        # Move ordering history kept from move to move like the transposition table
+        self.history = [0] * (2 * 64 * 64)
+        self.engine = Chess()
+        self.thread = None
+        self.state = None
+        # Set by stop before the search thread got its SearchState
+        self.stop_requested = False
+        # With go infinite/ponder bestmove may only be sent after stop
+        self.wait_for_stop = threading.Event()
+        # go ponder searches without a time limit until ponderhit
+        self.pondering = False
+        self.limits = {}
+
+    def send(self, line):
+        with self.lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def new_engine(self, fen):
+        return Chess(fen, incremental=True, evaluator=self.evaluator, book=self.book,
+                     tablebase=self.tablebase)
+
+    def replay(self, engine):
+        # The same position and move history with the current settings
+        board = engine.board
+        new = self.new_engine(board.root().fen())
+        for move in board.move_stack:
+            new.push(move)
+        return new
+
+    def position(self, tokens):
+        # position startpos [moves ...] / position fen <6 fields> [moves ...]
+        if 'moves' in tokens:
+            index = tokens.index('moves')
+            setup, moves = tokens[:index], tokens[index + 1:]
+        else:
+            setup, moves = tokens, []
+        if setup[:1] == ['fen']:
+            engine = self.new_engine(' '.join(setup[1:]))
+        else:
+            engine = self.new_engine(chess.STARTING_FEN)
+        for uci in moves:
+            engine.push(chess.Move.from_uci(uci))
+        self.engine = engine
+
+    def setoption(self, tokens):
+        # setoption name <name> value <value>
+        if 'value' not in tokens or tokens[:1] != ['name']:
+            return
+        index = tokens.index('value')
+        name = ' '.join(tokens[1:index]).lower()
+        value = ' '.join(tokens[index + 1:])
+        if name == 'hash':
+            self.hash_mb = int(value)
+            self.tt = TranspositionTable(self.hash_mb)
+        elif name == 'evaluator' and value in EVALUATORS:
+            self.evaluator = value
+        elif name == 'bookfile':
+            if self.book is not None:
+                self.book.close()
+            self.book = OpeningBook(value) if value and value != '<empty>' else None
+        elif name == 'tablebasepath':
+            if self.tablebase is not None:
+                self.tablebase.close()
+            self.tablebase = Tablebase(value) if value and value != '<empty>' else None
+        else:
+            return
+        self.engine = self.replay(self.engine)
+
+    def go(self, tokens):
+        self.stop()
+        limits = parse_go(tokens)
+        engine = copy.deepcopy(self.engine)
+        self.limits = limits
+        self.pondering = bool(limits.get('ponder'))
+        self.history[:] = [value // 2 for value in self.history]
+        self.stop_requested = False
+        self.wait_for_stop.clear()
+        if not limits.get('infinite') and not limits.get('ponder'):
+            self.wait_for_stop.set()
+        self.thread = threading.Thread(target=self.search, args=(engine, limits), daemon=True)
+        self.thread.start()
+
+    def search(self, engine, limits):
+        turn = engine.board.turn
+        last = {'move': None, 'pv': []}
+
+        def on_start(state):
+            with self.lock:
+                self.state = state
+                if self.stop_requested:
+                    state.stop()
+                elif limits.get('ponder') and not self.pondering:
+                    # ponderhit came before the search started
+                    self.start_clock(state)
+
+        def on_iteration(eval, move, info):
+            last['move'] = move
+            last['pv'] = info['pv']
+            nps = int(info['nodes'] / info['time']) if info['time'] > 0 else 0
+            self.send('info depth {} score {} nodes {} nps {} time {} pv {}'.format(
+                info['depth'], uci_score(eval, turn), info['nodes'], nps, int(info['time'] * 1000),
+                ' '.join(move.uci() for move in info['pv'])))
+
+        eval, move, info = iterative_deepening(engine, max_depth=limits.get('depth', 64),
+                                               time_limit=None if limits.get('ponder') else
+                                               time_for_move(limits, turn),
+                                               node_limit=limits.get('nodes'), tt=self.tt,
+                                               on_iteration=on_iteration, on_start=on_start,
+                                               history=self.history)
+        if info.get('book'):
+            self.send('info string book move')
+        elif info.get('tablebase'):
+            self.send('info string tablebase move')
+        if move is None:
+            # Stopped inside the first iteration
+            move = last['move']
+        if move is None:
+            move = next(iter(engine.board.legal_moves), None)
+        pv = info['pv'] if info['pv'] else last['pv']
+        self.wait_for_stop.wait()
+        self.state = None
+        if move is None:
+            self.send('bestmove 0000')
+        elif len(pv) > 1 and pv[0] == move:
+            # The reply we expect, for the GUI to let us ponder on
+            self.send('bestmove {} ponder {}'.format(move.uci(), pv[1].uci()))
+        else:
+            self.send('bestmove {}'.format(move.uci()))
+
+    def start_clock(self, state):
+        # The ponder search becomes a normal search: the time for this move counts from now
+        seconds = time_for_move(self.limits, self.engine.board.turn)
+        if seconds is not None:
+            state.set_time_limit(seconds)
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_requested = True
+        if self.state is not None:
+            self.state.stop()
+        self.wait_for_stop.set()
+        self.thread.join()
+        self.thread = None
+
+    def command(self, line):
+        """
+        Handle one line from the GUI
+        :return: False on quit
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        name, tokens = tokens[0], tokens[1:]
+        if name == 'uci':
+            self.send('id name ' + NAME)
+            self.send('id author ' + AUTHOR)
+            self.send('option name Hash type spin default 16 min 1 max 1024')
+            self.send('option name BookFile type string default <empty>')
+            self.send('option name TablebasePath type string default <empty>')
+            self.send('option name Evaluator type combo default squares ' +
+                      ' '.join('var ' + evaluator for evaluator in EVALUATORS))
+            self.send('uciok')
+        elif name == 'isready':
+            self.send('readyok')
+        elif name == 'ucinewgame':
+            self.stop()
+            self.tt.clear()
+            self.history[:] = [0] * len(self.history)
+            self.engine = self.new_engine(chess.STARTING_FEN)
+        elif name == 'setoption':
+            self.stop()
+            self.setoption(tokens)
+        elif name == 'position':
+            self.stop()
+            self.position(tokens)
+        elif name == 'go':
+            self.go(tokens)
+        elif name == 'stop':
+            self.stop()
+        elif name == 'ponderhit':
+            # The expected move was played: keep searching with the clock running, and send the move when done
+            with self.lock:
+                self.pondering = False
+                if self.state is not None:
+                    self.start_clock(self.state)
+            self.wait_for_stop.set()
+        elif name == 'quit':
+            self.stop()
+            return False
+        return True
+
+
+def main():
+    uci = UCI()
+    for line in sys.stdin:
+        if not uci.command(line):
+            break
+    uci.stop()
+
+
+if __name__ == '__main__':
+    main()
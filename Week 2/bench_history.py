@@ -0,0 +1,215 @@
+import argparse
+import contextlib
+import io
+import math
+import time
+import tracemalloc
+import q1
+import q2
+
+
+def run_q1(history_class):
+    q1.strategy_dict_x.clear()
+    q1.strategy_dict_o.clear()
+    q1.board_position_val_dict.clear()
+    q1.i = 0
+    start = time.perf_counter()
+    value = q1.backward_induction(history_class())
+    elapsed = time.perf_counter() - start
+    result = (value, dict(q1.strategy_dict_x), dict(q1.strategy_dict_o))
+    return result, q1.i, elapsed
+
+
+def run_q2(history_class, num_boards, solver):
+    q2.board_positions_val_dict.clear()
+    q2.board_positions_val_dict2.clear()
+    del q2.visited_histories_list[:]
+    del q2.visited_histories_list2[:]
+    start = time.perf_counter()
+    # alpha_beta_pruning prints its debugging output, keep it out of the table
+    with contextlib.redirect_stdout(io.StringIO()):
+        if solver == 'alpha_beta':
+            value = q2.alpha_beta_pruning(history_class(num_boards=num_boards), -math.inf, math.inf, True)
+            visited = q2.visited_histories_list
+        else:
+            value = q2.maxmin(history_class(num_boards=num_boards), True)
+            visited = q2.visited_histories_list2
+    elapsed = time.perf_counter() - start
+    result = (value, [list(history) for history in visited])
+    return result, len(visited), elapsed
+
+
+def compare(name, run):
+    # Run a solver with the list based and the bitmask History, check the results match and print nodes/second
+    rows = {}
+    for label in ('History', 'BitHistory'):
+        rows[label] = run(label)
+    (result, nodes, elapsed), (bit_result, bit_nodes, bit_elapsed) = rows['History'], rows['BitHistory']
+    same = 'same results' if result == bit_result else 'RESULTS DIFFER'
+    print('{:<22} {:>8} nodes  History {:>9.0f}/s  BitHistory {:>9.0f}/s  x{:.2f}  {}'.format(
+        name, nodes, nodes / elapsed, bit_nodes / bit_elapsed, elapsed / bit_elapsed, same))
+    return result == bit_result
+
+
+def compare_symmetry(num_boards):
+    # Positions solved and time with the plain memo tables and the symmetry canonicalized ones, same root value
+    q1.strategy_dict_x.clear()
+    q1.strategy_dict_o.clear()
+    q1.board_position_val_dict.clear()
+    q1.canonical_val_dict.clear()
+    start = time.perf_counter()
+    plain = q1.backward_induction(q1.BitHistory())
+    plain_elapsed = time.perf_counter() - start
+    plain_states = len(q1.board_position_val_dict)
+    start = time.perf_counter()
+    value = q1.backward_induction_canonical(q1.BitHistory())
+    elapsed = time.perf_counter() - start
+    print('{:<22} {:>8} states {:>7.2f}s  symmetry {:>6} states {:>7.2f}s  {}'.format(
+        'tictactoe backward', plain_states, plain_elapsed, len(q1.canonical_val_dict), elapsed,
+        'same value' if plain == value else 'VALUES DIFFER'))
+    ok = plain == value
+    for boards in range(1, num_boards + 1):
+        q2.board_positions_val_dict2.clear()
+        del q2.visited_histories_list2[:]
+        q2.canonical_val_dict.clear()
+        start = time.perf_counter()
+        plain = q2.maxmin(q2.BitHistory(num_boards=boards), True)
+        plain_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        value = q2.maxmin_canonical(q2.BitHistory(num_boards=boards), True)
+        elapsed = time.perf_counter() - start
+        print('{:<22} {:>8} states {:>7.2f}s  symmetry {:>6} states {:>7.2f}s  {}'.format(
+            'notakto {} maxmin'.format(boards), len(q2.board_positions_val_dict2), plain_elapsed,
+            len(q2.canonical_val_dict), elapsed, 'same value' if plain == value else 'VALUES DIFFER'))
+        ok = ok and plain == value
+    return ok
+
+
+def compare_quotient(num_boards):
+    # Every position maxmin_canonical solves against the misere quotient value, and the root against plain maxmin
+    # where it finishes
+    start = time.perf_counter()
+    q2.build_misere_quotient()
+    print('misere quotient: {} elements, {} P-positions, {} board values ({:.2f}s)'.format(
+        len(q2.QUOTIENT_PRODUCT), len(q2.QUOTIENT_P_POSITIONS), len(set(q2.QUOTIENT_VALUES.values())),
+        time.perf_counter() - start))
+    ok = True
+    for boards in range(1, num_boards + 1):
+        q2.canonical_val_dict.clear()
+        root = q2.maxmin_canonical(q2.BitHistory(num_boards=boards), True)
+        if boards <= 2:
+            q2.board_positions_val_dict2.clear()
+            del q2.visited_histories_list2[:]
+            root = q2.maxmin(q2.BitHistory(num_boards=boards), True)
+        wrong = 0 if q2.solve_misere_quotient(q2.BitHistory(num_boards=boards)) == root else 1
+        for (live, player), (value, action) in q2.canonical_val_dict.items():
+            # A position with these live boards and player to move, the other boards full
+            history_obj = q2.BitHistory(num_boards=boards, history=[0] * player)
+            history_obj.masks = list(live) + [511] * (boards - len(live))
+            history_obj.active_board_stats = history_obj.check_active_boards()
+            history_obj.live_boards = len(live)
+            if q2.solve_misere_quotient(history_obj) != value:
+                wrong = wrong + 1
+        print('notakto {} boards: {} positions checked, {} wrong'.format(boards, len(q2.canonical_val_dict) + 1,
+                                                                         wrong))
+        ok = ok and wrong == 0
+    for boards in (10, 100, 1000):
+        history_obj = q2.BitHistory(num_boards=boards)
+        start = time.perf_counter()
+        value = q2.solve_misere_quotient(history_obj)
+        action = q2.misere_quotient_action(history_obj)
+        print('notakto {} boards: value {} action {} ({:.1f} ms)'.format(
+            boards, value, action, (time.perf_counter() - start) * 1000))
+    return ok
+
+
+def compare_memo(num_boards, sizes):
+    # alpha_beta_memo with memo tables of several sizes against maxmin_canonical
+    ok = True
+    for boards in range(1, num_boards + 1):
+        q2.canonical_val_dict.clear()
+        expected = q2.maxmin_canonical(q2.BitHistory(num_boards=boards), True)
+        for size in sizes:
+            start = time.perf_counter()
+            value, memo, trace = q2.solve_alpha_beta_memo(q2.BitHistory(num_boards=boards), size=size)
+            elapsed = time.perf_counter() - start
+            print('notakto {} memo {:>7}: value {:>2} {:>8} nodes {:>6} entries {:>7} evictions {:>7.2f}s  {}'.format(
+                boards, size, value, trace.count, len(memo), memo.evictions, elapsed,
+                'same value' if value == expected else 'VALUES DIFFER'))
+            ok = ok and value == expected
+    return ok
+
+
+def measure(solve):
+    # (result, seconds, peak MiB allocated while solving)
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = solve()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def compare_iterative(grids):
+    # Recursive against explicit stack backward induction on tic-tac-toe, then the board memoized solver on grids
+    ok = True
+    results = {}
+    for name, solve in (('recursive', q1.backward_induction), ('iterative', q1.backward_induction_iterative)):
+        q1.strategy_dict_x.clear()
+        q1.strategy_dict_o.clear()
+        q1.board_position_val_dict.clear()
+        value, elapsed, peak = measure(lambda: solve(q1.BitHistory()))
+        results[name] = (value, dict(q1.strategy_dict_x), dict(q1.strategy_dict_o))
+        print('tictactoe {:<10} value {:>2} {:>7} histories {:>7.2f}s  peak {:>7.1f} MiB'.format(
+            name, value, len(q1.board_position_val_dict), elapsed, peak))
+    same = results['recursive'] == results['iterative']
+    print('same strategies' if same else 'STRATEGIES DIFFER')
+    ok = ok and same
+    for rows, cols, k in grids:
+        memo = {}
+        value, elapsed, peak = measure(lambda: q1.solve_positions(q1.GridHistory(rows, cols, k), memo))
+        print('{}x{} {} in a row: value {:>2} {:>8} boards {:>7.2f}s  peak {:>7.1f} MiB'.format(
+            rows, cols, k, value, len(memo), elapsed, peak))
+    return ok
+
+
+def parse_grid(text):
+    # 'rowsxcolsxk', e.g. 4x4x3
+    rows, cols, k = text.split('x')
+    return int(rows), int(cols), int(k)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Nodes per second of the Week 2 solvers with the list based History '
+                                                 'classes and the bitmask BitHistory classes')
+    parser.add_argument('--boards', type=int, default=2, help='most Notakto boards to solve (3 takes very long)')
+    parser.add_argument('--symmetry', action='store_true',
+                        help='compare the memo tables keyed by board with the symmetry canonicalized ones instead')
+    parser.add_argument('--quotient', action='store_true',
+                        help='check the misere quotient solver against maxmin for 1 to max(3, --boards) boards')
+    parser.add_argument('--memo', type=int, nargs='*',
+                        help='check alpha_beta_memo with these memo table sizes (default 100000 3000) against '
+                             'maxmin_canonical')
+    parser.add_argument('--iterative', type=parse_grid, nargs='*',
+                        help='check backward_induction_iterative against backward_induction and solve these '
+                             'rowsxcolsxk grids with solve_positions (default 3x3x3 3x4x3 4x4x3 4x4x4, 4x4x4 takes '
+                             'minutes with the memory tracing)')
+    args = parser.parse_args()
+
+    if args.iterative is not None:
+        ok = compare_iterative(args.iterative or [(3, 3, 3), (3, 4, 3), (4, 4, 3), (4, 4, 4)])
+    elif args.memo is not None:
+        ok = compare_memo(max(args.boards, 3), args.memo or [100000, 3000])
+    elif args.quotient:
+        ok = compare_quotient(max(args.boards, 3))
+    elif args.symmetry:
+        ok = compare_symmetry(args.boards)
+    else:
+        ok = compare('tictactoe backward', lambda label: run_q1(getattr(q1, label)))
+        for num_boards in range(1, args.boards + 1):
+            for solver in ('maxmin', 'alpha_beta'):
+                ok = compare('notakto {} {}'.format(num_boards, solver),
+                             lambda label: run_q2(getattr(q2, label), num_boards, solver)) and ok
+    if not ok:
+        raise SystemExit(1)
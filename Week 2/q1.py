@@ -2,9 +2,6 @@ import json
 import copy  # use it for deepcopy if needed
 import math  # for math.inf
 import logging
-import sys
-
-sys.setrecursionlimit(100000000)
 
 logging.basicConfig(format='%(levelname)s - %(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S',
                     level=logging.INFO)
@@ -165,6 +162,161 @@ class History:
         boards_str = boards_str + ''.join([str(i) for i in self.history])
         return boards_str
 
+# Bitmask representation: bit n is square n. The 8 lines of three in a row, and for every one of the 512 masks
+# whether it completes a line and which squares are still empty (in increasing order, as get_valid_actions)
+LINE_MASKS = [0b000000111, 0b000111000, 0b111000000, 0b001001001, 0b010010010, 0b100100100, 0b100010001,
+              0b001010100]
+FULL_BOARD = 0b111111111
+WINNING_MASKS = [any(mask & line == line for line in LINE_MASKS) for mask in range(512)]
+EMPTY_SQUARES = [tuple(square for square in range(9) if not mask >> square & 1) for mask in range(512)]
+
+
+class BitHistory:
+    # Same interface as History with the board kept as one bitmask per player, a move is a single OR
+    __slots__ = ('history', 'x_mask', 'o_mask', 'player')
+
+    def __init__(self, history=None):
+        self.history = history if history is not None else []
+        self.x_mask = 0
+        self.o_mask = 0
+        for i in range(len(self.history)):
+            if i % 2 == 0:
+                self.x_mask = self.x_mask | 1 << self.history[i]
+            else:
+                self.o_mask = self.o_mask | 1 << self.history[i]
+        self.player = self.current_player()
+
+    @property
+    def board(self):
+        return ['x' if self.x_mask >> i & 1 else 'o' if self.o_mask >> i & 1 else '0' for i in range(9)]
+
+    def current_player(self):
+        total_num_moves = len(self.history)
+        if total_num_moves < 9:
+            if total_num_moves % 2 == 0:
+                return 'x'
+            else:
+                return 'o'
+        return None
+
+    def get_board(self):
+        return self.board
+
+    def is_win(self):
+        if WINNING_MASKS[self.x_mask]:
+            return 1
+        if WINNING_MASKS[self.o_mask]:
+            return -1
+        return 0
+
+    def is_draw(self):
+        return self.x_mask | self.o_mask == FULL_BOARD and self.is_win() == 0
+
+    def get_valid_actions(self):
+        return EMPTY_SQUARES[self.x_mask | self.o_mask]
+
+    def is_terminal_history(self):
+        return self.is_win() != 0 or self.x_mask | self.o_mask == FULL_BOARD
+
+    def update_history(self, action):
+        child = BitHistory.__new__(BitHistory)
+        child.history = self.history + [action]
+        if self.player == 'x':
+            child.x_mask = self.x_mask | 1 << action
+            child.o_mask = self.o_mask
+        else:
+            child.x_mask = self.x_mask
+            child.o_mask = self.o_mask | 1 << action
+        child.player = child.current_player()
+        return child
+
+    def get_history_str(self):
+        return ''.join([str(i) for i in self.history])
+
+
+# The 8 symmetries of the board (rotations and reflections): SYMMETRIES[t][square] is where square goes under t
+SYMMETRIES = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8],
+    [2, 5, 8, 1, 4, 7, 0, 3, 6],
+    [8, 7, 6, 5, 4, 3, 2, 1, 0],
+    [6, 3, 0, 7, 4, 1, 8, 5, 2],
+    [2, 1, 0, 5, 4, 3, 8, 7, 6],
+    [6, 7, 8, 3, 4, 5, 0, 1, 2],
+    [0, 3, 6, 1, 4, 7, 2, 5, 8],
+    [8, 5, 2, 7, 4, 1, 6, 3, 0],
+]
+INVERSE_SYMMETRIES = [[perm.index(square) for square in range(9)] for perm in SYMMETRIES]
+SYMMETRY_MASKS = [[sum(1 << perm[square] for square in range(9) if mask >> square & 1) for mask in range(512)]
+                  for perm in SYMMETRIES]
+
+# Canonical board (x mask, o mask) -> (value, best action in the canonical orientation)
+canonical_val_dict = {}
+
+
+def canonical(x_mask, o_mask):
+    """
+    :return: ((x mask, o mask) smallest over the 8 symmetries, index of the symmetry that gives it)
+    """
+    best, best_t = None, 0
+    for t in range(8):
+        key = (SYMMETRY_MASKS[t][x_mask], SYMMETRY_MASKS[t][o_mask])
+        if best is None or key < best:
+            best, best_t = key, t
+    return best, best_t
+
+
+def solve_canonical(history_obj):
+    """
+    Backward induction memoized on the canonical board, so every board is solved once for all the histories and
+    rotations/reflections that reach it
+    :param history_obj: BitHistory object
+    :return: value of the board (1 x wins, 0 draw, -1 o wins)
+    """
+    key, t = canonical(history_obj.x_mask, history_obj.o_mask)
+    if key in canonical_val_dict:
+        return canonical_val_dict[key][0]
+    if history_obj.is_terminal_history():
+        canonical_val_dict[key] = (history_obj.is_win(), None)
+        return canonical_val_dict[key][0]
+    maximize = history_obj.player == 'x'
+    best, best_action = None, None
+    for action in history_obj.get_valid_actions():
+        value = solve_canonical(history_obj.update_history(action))
+        if best is None or (value > best if maximize else value < best):
+            best, best_action = value, action
+    canonical_val_dict[key] = (best, SYMMETRIES[t][best_action])
+    return best
+
+
+def canonical_action(history_obj):
+    # Best action of a solved board, mapped from the canonical orientation back to this board's
+    key, t = canonical(history_obj.x_mask, history_obj.o_mask)
+    return INVERSE_SYMMETRIES[t][canonical_val_dict[key][1]]
+
+
+def backward_induction_canonical(history_obj):
+    """
+    Solve with the symmetry canonicalized memo, then fill strategy_dict_x and strategy_dict_o for every history
+    :param history_obj: BitHistory object
+    :return: value of history_obj
+    """
+    value = solve_canonical(history_obj)
+    stack = [history_obj]
+    while stack:
+        node = stack.pop()
+        if node.is_terminal_history():
+            continue
+        temp = possible_actions.copy()
+        temp[canonical_action(node)] = 1
+        if node.player == 'x':
+            strategy_dict_x[node.get_history_str()] = temp
+        else:
+            strategy_dict_o[node.get_history_str()] = temp
+        for action in node.get_valid_actions():
+            stack.append(node.update_history(action))
+    return value
+
+
 i=0
 def backward_induction(history_obj):
     """
@@ -237,8 +389,300 @@ def backward_induction(history_obj):
     # TODO implement
 
 
-def solve_tictactoe():
-    backward_induction(History())
+def grid_lines(rows, cols, k):
+    """
+    :return: bitmasks of every k in a row (horizontal, vertical, both diagonals) on a rows x cols board
+    """
+    lines = []
+    for row in range(rows):
+        for col in range(cols):
+            for d_row, d_col in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                end_row, end_col = row + (k - 1) * d_row, col + (k - 1) * d_col
+                if 0 <= end_row < rows and 0 <= end_col < cols:
+                    lines.append(sum(1 << (row + n * d_row) * cols + col + n * d_col for n in range(k)))
+    return lines
+
+
+# (rows, cols, k) -> lines through every square, shared by all GridHistory objects of that game
+GRID_LINES = {}
+
+
+class GridHistory:
+    # k in a row on a rows x cols board with the History interface, squares numbered row by row.
+    # GridHistory(3, 3, 3) plays like History.
+    __slots__ = ('rows', 'cols', 'k', 'lines', 'history', 'x_mask', 'o_mask', 'player', 'winner')
+
+    def __init__(self, rows=3, cols=3, k=3, history=None):
+        self.rows = rows
+        self.cols = cols
+        self.k = k
+        if (rows, cols, k) not in GRID_LINES:
+            lines = grid_lines(rows, cols, k)
+            GRID_LINES[(rows, cols, k)] = [[line for line in lines if line >> square & 1]
+                                          for square in range(rows * cols)]
+        self.lines = GRID_LINES[(rows, cols, k)]
+        self.history = history if history is not None else []
+        self.x_mask = 0
+        self.o_mask = 0
+        self.winner = 0
+        for i in range(len(self.history)):
+            if i % 2 == 0:
+                self.x_mask = self.x_mask | 1 << self.history[i]
+            else:
+                self.o_mask = self.o_mask | 1 << self.history[i]
+        for square in range(rows * cols):
+            for line in self.lines[square]:
+                if self.x_mask & line == line:
+                    self.winner = 1
+                elif self.o_mask & line == line:
+                    self.winner = -1
+        self.player = self.current_player()
+
+    @property
+    def board(self):
+        return ['x' if self.x_mask >> i & 1 else 'o' if self.o_mask >> i & 1 else '0'
+                for i in range(self.rows * self.cols)]
+
+    def current_player(self):
+        total_num_moves = len(self.history)
+        if total_num_moves < self.rows * self.cols:
+            if total_num_moves % 2 == 0:
+                return 'x'
+            else:
+                return 'o'
+        return None
+
+    def get_board(self):
+        return self.board
+
+    def is_win(self):
+        return self.winner
+
+    def is_draw(self):
+        return self.winner == 0 and len(self.history) == self.rows * self.cols
+
+    def get_valid_actions(self):
+        occupied = self.x_mask | self.o_mask
+        return [square for square in range(self.rows * self.cols) if not occupied >> square & 1]
+
+    def is_terminal_history(self):
+        return self.winner != 0 or len(self.history) == self.rows * self.cols
+
+    def update_history(self, action):
+        child = GridHistory.__new__(GridHistory)
+        child.rows, child.cols, child.k, child.lines = self.rows, self.cols, self.k, self.lines
+        child.history = self.history + [action]
+        child.x_mask, child.o_mask = self.x_mask, self.o_mask
+        if self.player == 'x':
+            child.x_mask = child.x_mask | 1 << action
+            mask, winner = child.x_mask, 1
+        else:
+            child.o_mask = child.o_mask | 1 << action
+            mask, winner = child.o_mask, -1
+        # Only a line through the new stone can have been completed
+        child.winner = self.winner
+        for line in self.lines[action]:
+            if mask & line == line:
+                child.winner = winner
+                break
+        child.player = child.current_player()
+        return child
+
+    def get_history_str(self):
+        # Squares above 9 need a separator to keep the keys unique
+        if self.rows * self.cols <= 10:
+            return ''.join([str(i) for i in self.history])
+        return ','.join([str(i) for i in self.history])
+
+
+def backward_induction_iterative(history_obj):
+    """
+    backward_induction with an explicit stack instead of recursion: same strategy_dict_x, strategy_dict_o and
+    board_position_val_dict (every history, first best action), no recursion limit to raise
+    :param history_obj: History, BitHistory or GridHistory object
+    :return: best achievable utility (float) for history_obj
+    """
+    if history_obj.is_terminal_history():
+        return history_obj.is_win()
+    size = len(history_obj.get_board())
+    template = possible_actions if size == 9 else dict.fromkeys(range(size), 0)
+    # Frames: [history, valid actions, index of the next action, best value, best action]
+    stack = [[history_obj, history_obj.get_valid_actions(), 0, None, None]]
+    value = None
+    while stack:
+        frame = stack[-1]
+        if value is not None:
+            # Value of the child reached with the previous action
+            if frame[3] is None or (value > frame[3] if frame[0].player == 'x' else value < frame[3]):
+                frame[3] = value
+                frame[4] = frame[1][frame[2] - 1]
+            value = None
+        if frame[2] < len(frame[1]):
+            child = frame[0].update_history(frame[1][frame[2]])
+            frame[2] = frame[2] + 1
+            if child.is_terminal_history():
+                value = child.is_win()
+            else:
+                stack.append([child, child.get_valid_actions(), 0, None, None])
+            continue
+        stack.pop()
+        node, best, best_action = frame[0], frame[3], frame[4]
+        history_str = node.get_history_str()
+        temp = template.copy()
+        temp[best_action] = 1
+        if node.player == 'x':
+            strategy_dict_x[history_str] = temp
+        else:
+            strategy_dict_o[history_str] = temp
+        board_position_val_dict[history_str] = best
+        value = best
+    return value
+
+
+def grid_symmetries(rows, cols):
+    """
+    :return: square permutations that map a rows x cols board onto itself, perm[square] is where square goes like
+             in SYMMETRIES (the same 8 for 3x3, 4 when the board isn't square)
+    """
+    perms = []
+    for transpose in ((False, True) if rows == cols else (False,)):
+        for flip_rows in (False, True):
+            for flip_cols in (False, True):
+                perm = []
+                for square in range(rows * cols):
+                    row, col = divmod(square, cols)
+                    if flip_rows:
+                        row = rows - 1 - row
+                    if flip_cols:
+                        col = cols - 1 - col
+                    if transpose:
+                        row, col = col, row
+                    perm.append(row * cols + col)
+                perms.append(perm)
+    return perms
+
+
+def key_tables(perm):
+    # Byte lookup tables that move the bits of a board key (x mask << squares | o mask) like perm moves squares
+    squares = len(perm)
+    moved = perm + [squares + square for square in perm]
+    tables = []
+    for start in range(0, 2 * squares, 8):
+        table = []
+        for byte in range(256):
+            value = 0
+            for bit in range(min(8, 2 * squares - start)):
+                if byte >> bit & 1:
+                    value = value | 1 << moved[start + bit]
+            table.append(value)
+        tables.append((start, table))
+    return tables
+
+
+# (rows, cols) -> (symmetries, key tables of every symmetry), shared by all boards of that size
+GRID_SYMMETRIES = {}
+
+
+def board_symmetries(history_obj):
+    # Symmetries and key tables for the board of a BitHistory (3x3) or GridHistory object
+    if isinstance(history_obj, GridHistory):
+        shape = (history_obj.rows, history_obj.cols)
+    else:
+        shape = (3, 3)
+    if shape not in GRID_SYMMETRIES:
+        perms = grid_symmetries(*shape)
+        GRID_SYMMETRIES[shape] = (perms, [key_tables(perm) for perm in perms])
+    return GRID_SYMMETRIES[shape]
+
+
+def grid_canonical(key, tables):
+    """
+    :param key: board key, x mask << squares | o mask
+    :param tables: key tables of every symmetry
+    :return: (smallest key over the symmetries, index of the symmetry that gives it)
+    """
+    # The first symmetry is the identity
+    best, best_t = key, 0
+    for t in range(1, len(tables)):
+        moved = 0
+        for start, table in tables[t]:
+            moved = moved | table[key >> start & 255]
+        if moved < best:
+            best, best_t = moved, t
+    return best, best_t
+
+
+def solve_positions(history_obj, memo):
+    """
+    Explicit stack solver memoized on the board instead of the history, for boards where the game tree is far too
+    big to give every history a strategy (4x4 has about 16! histories). A player stops looking at moves once one
+    reaches the best value possible for them, so every stored value is exact. Boards are stored once up to
+    rotation/reflection, under one int and with one small int each to keep the memo small.
+    :param history_obj: BitHistory or GridHistory object
+    :param memo: dict canonical board key -> best action in the canonical orientation * 3 + value + 1, filled for
+                 every board solved. Read it with position_value.
+    :return: best achievable utility of history_obj
+    """
+    if history_obj.is_terminal_history():
+        return history_obj.is_win()
+    perms, tables = board_symmetries(history_obj)
+    squares = len(perms[0])
+    key, t = grid_canonical(history_obj.x_mask << squares | history_obj.o_mask, tables)
+    # Frames: [history, valid actions, index of the next action, best value, best action, canonical key, symmetry]
+    stack = [[history_obj, history_obj.get_valid_actions(), 0, None, None, key, t]]
+    value = None
+    while stack:
+        frame = stack[-1]
+        node = frame[0]
+        if value is not None:
+            if frame[3] is None or (value > frame[3] if node.player == 'x' else value < frame[3]):
+                frame[3] = value
+                frame[4] = frame[1][frame[2] - 1]
+            value = None
+        done = frame[3] == (1 if node.player == 'x' else -1)
+        if not done and frame[2] < len(frame[1]):
+            child = node.update_history(frame[1][frame[2]])
+            frame[2] = frame[2] + 1
+            if child.is_terminal_history():
+                value = child.is_win()
+                continue
+            key, t = grid_canonical(child.x_mask << squares | child.o_mask, tables)
+            if key in memo:
+                value = memo[key] % 3 - 1
+            else:
+                stack.append([child, child.get_valid_actions(), 0, None, None, key, t])
+            continue
+        stack.pop()
+        memo[frame[5]] = perms[frame[6]][frame[4]] * 3 + frame[3] + 1
+        value = frame[3]
+    return value
+
+
+def position_value(history_obj, memo):
+    """
+    :param memo: memo filled by solve_positions
+    :return: (value, best action in this board's orientation) of a solved non terminal board
+    """
+    perms, tables = board_symmetries(history_obj)
+    squares = len(perms[0])
+    key, t = grid_canonical(history_obj.x_mask << squares | history_obj.o_mask, tables)
+    packed = memo[key]
+    return packed % 3 - 1, perms[t].index(packed // 3)
+
+
+def solve_tictactoe(history_class=History, symmetry=False, iterative=False):
+    """
+    :param history_class: History, or BitHistory for the faster bitmask boards (same policies)
+    :param symmetry: solve every board once up to rotation/reflection (BitHistory only). The policies are optimal
+                     as well but may pick a different one of equally good actions.
+    :param iterative: use backward_induction_iterative (same policies, no recursion)
+    """
+    if symmetry:
+        backward_induction_canonical(BitHistory())
+    elif iterative:
+        backward_induction_iterative(history_class())
+    else:
+        backward_induction(history_class())
     with open('./policy_x.json', 'w') as f:
         json.dump(strategy_dict_x, f)
     with open('./policy_o.json', 'w') as f:
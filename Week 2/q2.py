@@ -1,6 +1,7 @@
 import copy  # use it for deepcopy if needed
 import math
 import logging
+from collections import OrderedDict
 
 logging.basicConfig(format='%(levelname)s - %(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S',
                     level=logging.INFO)
@@ -234,6 +235,80 @@ class History:
 
 
 
+# Bitmask representation of a board: bit n is square n. The 8 lines of three in a row, and for every one of the
+# 512 masks whether it completes a line, its empty squares in the get_valid_actions order (center, corners, edges)
+# and its get_boards_str text
+LINE_MASKS = [0b000000111, 0b000111000, 0b111000000, 0b001001001, 0b010010010, 0b100100100, 0b100010001,
+              0b001010100]
+ACTION_ORDER = [4, 0, 2, 6, 8, 1, 3, 5, 7]
+DEAD_BOARDS = [any(mask & line == line for line in LINE_MASKS) for mask in range(512)]
+EMPTY_SQUARES = [[square for square in ACTION_ORDER if not mask >> square & 1] for mask in range(512)]
+BOARD_STRS = [''.join('x' if mask >> square & 1 else '0' for square in range(9)) for mask in range(512)]
+
+
+class BitHistory:
+    # Same interface as History with every board kept as a 9 bit mask, a move is a single OR on one board
+    __slots__ = ('num_boards', 'history', 'masks', 'active_board_stats', 'live_boards', 'current_player')
+
+    def __init__(self, num_boards=2, history=None):
+        self.num_boards = num_boards
+        self.history = history if history is not None else []
+        self.masks = [0] * num_boards
+        for action in self.history:
+            self.masks[action // 9] = self.masks[action // 9] | 1 << action % 9
+        self.active_board_stats = self.check_active_boards()
+        self.live_boards = sum(self.active_board_stats)
+        self.current_player = self.get_current_player()
+
+    @property
+    def boards(self):
+        return [list(BOARD_STRS[mask]) for mask in self.masks]
+
+    def get_boards(self):
+        return self.boards
+
+    def check_active_boards(self):
+        return [0 if DEAD_BOARDS[mask] else 1 for mask in self.masks]
+
+    def get_current_player(self):
+        return 1 if len(self.history) % 2 == 0 else 2
+
+    def get_boards_str(self):
+        return ''.join([BOARD_STRS[mask] for mask in self.masks])
+
+    def is_win(self):
+        if self.live_boards:
+            return 0
+        return 1 if self.current_player == 1 else -1
+
+    def get_valid_actions(self):
+        actions = []
+        for i in range(self.num_boards):
+            if self.active_board_stats[i]:
+                offset = 9 * i
+                actions.extend([offset + square for square in EMPTY_SQUARES[self.masks[i]]])
+        return actions
+
+    def is_terminal_history(self):
+        return self.live_boards == 0
+
+    def update_history(self, action):
+        board = action // 9
+        child = BitHistory.__new__(BitHistory)
+        child.num_boards = self.num_boards
+        child.history = self.history + [action]
+        child.masks = list(self.masks)
+        child.masks[board] = child.masks[board] | 1 << action % 9
+        child.active_board_stats = self.active_board_stats
+        child.live_boards = self.live_boards
+        if DEAD_BOARDS[child.masks[board]]:
+            child.active_board_stats = list(self.active_board_stats)
+            child.active_board_stats[board] = 0
+            child.live_boards = self.live_boards - 1
+        child.current_player = 2 if self.current_player == 1 else 1
+        return child
+
+
 i=0
 def alpha_beta_pruning(history_obj, alpha, beta, max_player_flag):
     """
@@ -353,18 +428,363 @@ def maxmin(history_obj, max_player_flag):
     # TODO implement
 
 
+# The 8 symmetries of a board (rotations and reflections): SYMMETRIES[t][square] is where square goes under t. A
+# board is canonical when its mask is the smallest of its 8 images.
+SYMMETRIES = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8],
+    [2, 5, 8, 1, 4, 7, 0, 3, 6],
+    [8, 7, 6, 5, 4, 3, 2, 1, 0],
+    [6, 3, 0, 7, 4, 1, 8, 5, 2],
+    [2, 1, 0, 5, 4, 3, 8, 7, 6],
+    [6, 7, 8, 3, 4, 5, 0, 1, 2],
+    [0, 3, 6, 1, 4, 7, 2, 5, 8],
+    [8, 5, 2, 7, 4, 1, 6, 3, 0],
+]
+SYMMETRY_MASKS = [[sum(1 << perm[square] for square in range(9) if mask >> square & 1) for mask in range(512)]
+                  for perm in SYMMETRIES]
+CANONICAL_MASKS = [min(table[mask] for table in SYMMETRY_MASKS) for mask in range(512)]
+
+# Canonical position -> (maxmin value, best action as (canonical board mask, square on it))
+canonical_val_dict = {}
+
+
+def board_masks(history_obj):
+    if isinstance(history_obj, BitHistory):
+        return history_obj.masks
+    return [sum(1 << square for square in range(9) if board[square] != '0') for board in history_obj.boards]
+
+
+def canonical_key(history_obj):
+    """
+    Key shared by every position that is the same game: each live board up to rotation/reflection, the boards in any
+    order, dead boards left out (nothing can be played on them). The player to move is kept since is_win depends on
+    it and dead boards no longer tell the number of moves.
+    :return: (sorted canonical masks of the live boards, 0 or 1 for player 1 or 2 to move)
+    """
+    masks = board_masks(history_obj)
+    live = [CANONICAL_MASKS[mask] for mask in masks if not DEAD_BOARDS[mask]]
+    live.sort()
+    return tuple(live), len(history_obj.history) % 2
+
+
+def maxmin_canonical(history_obj, max_player_flag):
+    """
+        maxmin with board positions stored under canonical_key, so the symmetric and reordered copies of a position
+        are solved once
+    :param history_obj: History or BitHistory object
+    :param max_player_flag: True if the player is maximizing player
+    :return: float
+    """
+    if history_obj.is_terminal_history():
+        return history_obj.is_win()
+    key = canonical_key(history_obj)
+    if key in canonical_val_dict:
+        return canonical_val_dict[key][0]
+    masks = board_masks(history_obj)
+    best, best_action = None, None
+    for action in history_obj.get_valid_actions():
+        eval = maxmin_canonical(history_obj.update_history(action), not max_player_flag)
+        if best is None or (eval > best if max_player_flag else eval < best):
+            best, best_action = eval, action
+    # Keep the action in the canonical orientation, every position with this key can map it back
+    mask = masks[best_action // 9]
+    t = next(t for t in range(8) if SYMMETRY_MASKS[t][mask] == CANONICAL_MASKS[mask])
+    canonical_val_dict[key] = (best, (CANONICAL_MASKS[mask], SYMMETRIES[t][best_action % 9]))
+    return best
+
+
+def canonical_action(history_obj):
+    """
+    Best action of a position solved by maxmin_canonical, in the orientation and board order of history_obj
+    :return: action (9 * board + square)
+    """
+    canonical_mask, canonical_square = canonical_val_dict[canonical_key(history_obj)][1]
+    for i, mask in enumerate(board_masks(history_obj)):
+        if DEAD_BOARDS[mask] or CANONICAL_MASKS[mask] != canonical_mask:
+            continue
+        for t, table in enumerate(SYMMETRY_MASKS):
+            if table[mask] == canonical_mask:
+                return 9 * i + SYMMETRIES[t].index(canonical_square)
+    return None
+
+
+# Misere quotient of Notakto: every live board has an element of a small commutative monoid, a position is worth the
+# product over its boards and is lost for the player to move when the product is a P-position. Element 0 is the
+# identity (no live boards). Filled once by build_misere_quotient().
+QUOTIENT_VALUES = {}  # canonical mask of a live board -> element
+QUOTIENT_PRODUCT = []  # QUOTIENT_PRODUCT[x][y] -> element of x * y
+QUOTIENT_P_POSITIONS = set()
+
+
+def sum_outcome(boards, options, memo):
+    """
+    Outcome of a sum of boards by plain search, the player who kills the last board loses
+    :param boards: sorted tuple of boards
+    :param options: dict board -> boards one move on it leads to, None when the move kills it
+    :param memo: dict of outcomes already known for these options
+    :return: True if the player to move wins
+    """
+    if not boards:
+        return True
+    if boards in memo:
+        return memo[boards]
+    win = False
+    for i, board in enumerate(boards):
+        if win:
+            break
+        if i > 0 and boards[i - 1] == board:
+            continue
+        rest = boards[:i] + boards[i + 1:]
+        for child in options[board]:
+            after = rest if child is None else tuple(sorted(rest + (child,)))
+            if not sum_outcome(after, options, memo):
+                win = True
+                break
+    memo[boards] = win
+    return win
+
+
+def build_misere_quotient():
+    """
+    Compute the misere quotient from the single boards. Boards are grouped by the outcome of their sums with every
+    sum of up to 2 other boards, one board per group is enough from then on. Products of groups are told apart by
+    their outcomes with every sum of up to 3 groups. This gives the 18 element monoid with 4 P-positions found by
+    Plambeck; bench_history.py --quotient checks it against maxmin.
+    """
+    if QUOTIENT_PRODUCT:
+        return
+    live = sorted(set(CANONICAL_MASKS[mask] for mask in range(512) if not DEAD_BOARDS[mask]))
+    options = {}
+    for mask in live:
+        children = set()
+        for square in EMPTY_SQUARES[mask]:
+            child = mask | 1 << square
+            children.add(None if DEAD_BOARDS[child] else CANONICAL_MASKS[child])
+        options[mask] = list(children)
+
+    memo = {}
+    tests = [()] + [(board,) for board in live] + [(a, b) for a in live for b in live if a <= b]
+    groups = {}
+    for board in live:
+        profile = tuple(sum_outcome(tuple(sorted((board,) + test)), options, memo) for test in tests)
+        groups.setdefault(profile, []).append(board)
+    group_of = {board: n for n, boards in enumerate(groups.values()) for board in boards}
+    # Any board of a group has the moves of the group. Take the one with the most stones, its moves can't stay in
+    # the group, so sums of groups still end.
+    group_options = {}
+    for n, boards in enumerate(groups.values()):
+        board = max(boards, key=lambda mask: bin(mask).count('1'))
+        group_options[n] = list(set(None if child is None else group_of[child] for child in options[board]))
+
+    memo = {}
+    num_groups = len(groups)
+    tests = [()]
+    for size in range(3):
+        tests = tests + [test + (n,) for test in tests if len(test) == size for n in range(num_groups)
+                         if not test or test[-1] <= n]
+
+    def profile(groups_sum):
+        return tuple(sum_outcome(tuple(sorted(groups_sum + test)), group_options, memo) for test in tests)
+
+    # Breadth first over products of groups, keeping one sum per element
+    elements = {profile(()): 0}
+    sums = [()]
+    k = 0
+    while k < len(sums):
+        for n in range(num_groups):
+            product = tuple(sorted(sums[k] + (n,)))
+            key = profile(product)
+            if key not in elements:
+                elements[key] = len(sums)
+                sums.append(product)
+        k = k + 1
+    for x in range(len(sums)):
+        QUOTIENT_PRODUCT.append([elements[profile(tuple(sorted(sums[x] + sums[y])))] for y in range(len(sums))])
+        if not sum_outcome(sums[x], group_options, memo):
+            QUOTIENT_P_POSITIONS.add(x)
+    for board in live:
+        QUOTIENT_VALUES[board] = elements[profile((group_of[board],))]
+
+
+def quotient_value(history_obj):
+    """
+    :param history_obj: History or BitHistory object
+    :return: misere quotient element of the position, one table lookup per board
+    """
+    build_misere_quotient()
+    value = 0
+    for mask in board_masks(history_obj):
+        if not DEAD_BOARDS[mask]:
+            value = QUOTIENT_PRODUCT[value][QUOTIENT_VALUES[CANONICAL_MASKS[mask]]]
+    return value
+
+
+def solve_misere_quotient(history_obj):
+    """
+        Value of the position as maxmin gives it, from the misere quotient instead of a search: linear in the number
+        of boards
+    :param history_obj: History or BitHistory object
+    :return: 1 if player 1 wins, -1 if player 2 wins
+    """
+    lost = quotient_value(history_obj) in QUOTIENT_P_POSITIONS
+    if lost == (history_obj.get_current_player() == 1):
+        return -1
+    return 1
+
+
+def misere_quotient_action(history_obj):
+    """
+    A move leaving a P-position, from the products of the boards before and after the one played on
+    :param history_obj: History or BitHistory object
+    :return: winning action, or the first valid action when every move loses
+    """
+    build_misere_quotient()
+    values = [0 if DEAD_BOARDS[mask] else QUOTIENT_VALUES[CANONICAL_MASKS[mask]] for mask in board_masks(history_obj)]
+    after = [0] * (len(values) + 1)
+    for i in range(len(values) - 1, -1, -1):
+        after[i] = QUOTIENT_PRODUCT[values[i]][after[i + 1]]
+    before = 0
+    for i, mask in enumerate(board_masks(history_obj)):
+        if not DEAD_BOARDS[mask]:
+            others = QUOTIENT_PRODUCT[before][after[i + 1]]
+            for square in EMPTY_SQUARES[mask]:
+                child = mask | 1 << square
+                value = 0 if DEAD_BOARDS[child] else QUOTIENT_VALUES[CANONICAL_MASKS[child]]
+                if QUOTIENT_PRODUCT[others][value] in QUOTIENT_P_POSITIONS:
+                    return 9 * i + square
+        before = QUOTIENT_PRODUCT[before][values[i]]
+    actions = history_obj.get_valid_actions()
+    return actions[0] if actions else None
+
+
 def solve_alpha_beta_pruning(history_obj, alpha, beta, max_player_flag):
     global visited_histories_list
     val = alpha_beta_pruning(history_obj, alpha, beta, max_player_flag)
     return val, visited_histories_list
 
 
+# Bound types stored in an AlphaBetaMemo
+EXACT = 0
+LOWER = 1  # search failed high, the real value is >= the stored one
+UPPER = 2  # search failed low, the real value is <= the stored one
+
+
+class AlphaBetaMemo:
+    def __init__(self, size=100000):
+        """
+        Memo table of alpha_beta_memo: canonical_key -> (value, bound type), least recently used entries evicted
+        :param size: maximum number of positions kept
+        """
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, value, bound):
+        self.entries[key] = (value, bound)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions = self.evictions + 1
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class HistoryTrace:
+    def __init__(self, mode='count'):
+        """
+        Visited histories of a search
+        :param mode: 'count' only counts them, 'list' also keeps a copy of every history like visited_histories_list
+        """
+        self.mode = mode
+        self.count = 0
+        self.histories = []
+
+    def visit(self, history_obj):
+        self.count = self.count + 1
+        if self.mode == 'list':
+            self.histories.append(list(history_obj.history))
+
+
+def alpha_beta_memo(history_obj, alpha, beta, max_player_flag, memo, trace=None):
+    """
+        alpha beta pruning with a memo table that knows which values are only bounds: a search cut off by
+        alpha/beta stores a lower or upper bound, which narrows the window the next time instead of being returned
+    :param history_obj: History or BitHistory object
+    :param alpha: -math.inf
+    :param beta: math.inf
+    :param max_player_flag: Bool (True if maximizing player plays)
+    :param memo: AlphaBetaMemo
+    :param trace: HistoryTrace, or None for no tracing
+    :return: float
+    """
+    if trace is not None:
+        trace.visit(history_obj)
+    if history_obj.is_terminal_history():
+        return history_obj.is_win()
+    key = canonical_key(history_obj)
+    entry = memo.get(key)
+    if entry is not None:
+        value, bound = entry
+        if bound == EXACT:
+            return value
+        if bound == LOWER:
+            alpha = max(alpha, value)
+        else:
+            beta = min(beta, value)
+        if alpha >= beta:
+            return value
+    alpha_start, beta_start = alpha, beta
+    best = -math.inf if max_player_flag else math.inf
+    for action in history_obj.get_valid_actions():
+        eval = alpha_beta_memo(history_obj.update_history(action), alpha, beta, not max_player_flag, memo, trace)
+        if max_player_flag:
+            best = max(best, eval)
+            alpha = max(alpha, eval)
+        else:
+            best = min(best, eval)
+            beta = min(beta, eval)
+        if alpha >= beta:
+            break
+    if best <= alpha_start:
+        memo.put(key, best, UPPER)
+    elif best >= beta_start:
+        memo.put(key, best, LOWER)
+    else:
+        memo.put(key, best, EXACT)
+    return best
+
+
+def solve_alpha_beta_memo(history_obj, max_player_flag=True, size=100000, trace='count'):
+    """
+    :param size: most positions kept in the memo table
+    :param trace: 'count', 'list' or None, see HistoryTrace
+    :return: (value, AlphaBetaMemo, HistoryTrace or None)
+    """
+    memo = AlphaBetaMemo(size)
+    history_trace = HistoryTrace(trace) if trace is not None else None
+    val = alpha_beta_memo(history_obj, -math.inf, math.inf, max_player_flag, memo, history_trace)
+    return val, memo, history_trace
+
+
 if __name__ == "__main__":
     logging.info("start")
     logging.info("alpha beta pruning")
-    value, visited_histories = solve_alpha_beta_pruning(History(history=[], num_boards=3), -math.inf, math.inf, True)
+    value, memo, trace = solve_alpha_beta_memo(History(history=[], num_boards=3))
     logging.info("maxmin value {}".format(value))
-    logging.info("Number of histories visited {}".format(len(visited_histories)))
+    logging.info("Number of histories visited {}".format(trace.count))
+    logging.info("Memo entries {} (hits {}, evictions {})".format(len(memo), memo.hits, memo.evictions))
     logging.info("maxmin memory")
     # logging.info("maxmin value {}".format(maxmin(History(history=[], num_boards=2), True)))
     # logging.info("Number of histories visited {}".format(len(visited_histories_list2)))